@@ -1,3 +1,5 @@
+from .batch import batch_diff
 from .combination import Combination
 from .composition import Composition
 from .diff import Difference
+from .staged import StagedDifference
@@ -2,11 +2,19 @@ __author__ = "Vanessa Sochat"
 __copyright__ = "Copyright 2022-2024, Vanessa Sochat"
 __license__ = "MIT"
 
-
+import asyncio
+import concurrent.futures
+import hashlib
 import sys
 
+import clingo
+
 import compspec.asp.lp as lp
-from compspec.solver import fn
+import compspec.solver
+import compspec.utils as utils
+from compspec.cache import content_hash
+from compspec.graph import symbol_key
+from compspec.version import __version__
 
 
 class CompositionBase:
@@ -14,6 +22,16 @@ class CompositionBase:
     A composition base is the base for a Composition or Diff.
     """
 
+    # A ResultCache for answers, if results are cached
+    cache = None
+
+    def set_driver(self, driver=None, profile=None, threads=None, ground_only=None):
+        """
+        Use a driver (or a new PyclingoDriver), with any solver options given.
+        """
+        self.driver = driver or compspec.solver.PyclingoDriver()
+        self.driver.set_options(profile, threads, ground_only)
+
     def set_verbosity(self, out, quiet=False):
         """
         Set the verbosity
@@ -24,15 +42,70 @@ class CompositionBase:
         self.out = out
         self.driver.set_verbosity(out)
 
-    def solve(self, logic_programs=None):
+    def close(self):
+        """
+        Close the output file for facts, if the driver opened one.
+        """
+        self.driver.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # The default logic programs (or none) have one answer set, so we can
+    # stop at the first model when we only run them
+    _deterministic = True
+
+    def default_nmodels(self, logic_programs):
+        """
+        Stop at the first model (1) for the default logic programs, and
+        otherwise find all models (0) to choose the best.
+        """
+        defaults = list(getattr(self, "_logic_programs", []))
+        if defaults:
+            defaults = lp.get_facts(defaults)
+        if self._deterministic and (logic_programs or []) == defaults:
+            return 1
+        return 0
+
+    def solve(self, logic_programs=None, nmodels=None, timeout=None):
         """
         Run the solve, optionally with extra logic programs.
+
+        Without logic programs the answers are the facts, so we generate
+        them without a solver.
         """
-        result = self.driver.solve(self.facts, logic_programs=logic_programs)
+        if nmodels is None:
+            nmodels = self.default_nmodels(logic_programs)
+        result = self.driver.solve(
+            self.facts,
+            nmodels=nmodels,
+            logic_programs=logic_programs,
+            facts_only=not logic_programs,
+            timeout=timeout,
+        )
+
+        # The full result (including timings and statistics) is kept here
+        self.result = result
         if result.answers and hasattr(self, "prepare_result"):
             result.answers = self.prepare_result(result.answers)
         return result.answers
 
+    def dump(self, filename):
+        """
+        Write the facts to a logic program file (gzip compressed if it ends
+        in .gz), without a solver and without keeping them.
+        """
+        out = self.driver.out
+        with utils.open_output(filename) as fd:
+            self.driver.out = fd
+            try:
+                self.driver.generate(self.facts, collect=False)
+            finally:
+                self.driver.out = out
+
     def _load_logic_programs(self, logic_programs=None, omit_default=False):
         """
         Load user- and class- provided logic programs.
@@ -47,14 +120,133 @@ class CompositionBase:
             logic_programs = lp.get_facts(logic_programs)
         return logic_programs
 
-    def run(self, logic_programs=None, quiet=False, omit_default=False):
+    def cache_key(self, logic_programs=None, nmodels=None):
+        """
+        Derive the key for the answers from a run, from the fingerprint of
+        each graph, the namespaces and settings, and the logic programs.
+        """
+        fields = [
+            self.__class__.__name__,
+            str(getattr(self, "engine", "")),
+            str(getattr(self, "levels", "")),
+            str(nmodels),
+            __version__,
+        ]
+        fields += self.facts.fingerprint()
+        fields += [content_hash(filename) for filename in logic_programs or []]
+        return hashlib.sha256("\0".join(fields).encode("utf-8")).hexdigest()
+
+    def run(
+        self,
+        logic_programs=None,
+        quiet=False,
+        omit_default=False,
+        nmodels=None,
+        timeout=None,
+    ):
         """
         Run of a composition will output ASP facts, unless a logic program
         is provided then we do this full solve. Omit defaut logic programs
-        (if defined) given omit_default is True.
+        (if defined) given omit_default is True. The number of models to
+        find (0 for all) defaults to 1 for only the default programs.
+        With a timeout (seconds) the search is stopped when it runs out, and
+        self.result is flagged as interrupted. With a cache, answers for the
+        same graphs and logic programs are returned without a solve.
         """
+        # An interrupt is for the run in progress, e.g., if a task was
+        # cancelled after the last search finished, it is not for this one
+        self.driver.interrupted = False
         logic_programs = self._load_logic_programs(logic_programs, omit_default)
-        return self.solve(logic_programs=logic_programs)
+        key = None
+        if self.cache is not None:
+            key = self.cache_key(logic_programs, nmodels)
+            found = self.cache.get(key)
+            if found is not None:
+                self.result = compspec.solver.Result()
+                self.result.satisfiable = found["satisfiable"]
+                self.result.answers = found["answers"]
+                self.result.nmodels = found["nmodels"]
+                self.result.cached = True
+                return self.result.answers
+
+        answers = self.solve(
+            logic_programs=logic_programs, nmodels=nmodels, timeout=timeout
+        )
+        if key is not None and not self.result.interrupted:
+            self.cache.set(key, self.result)
+        return answers
+
+    async def run_async(self, *args, **kwargs):
+        """
+        Run in a worker thread, so we don't block the event loop.
+
+        This takes the same arguments as run (including a timeout). If the
+        task is cancelled we interrupt the solve, or if the run has not
+        started, it never does.
+        """
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        future = executor.submit(self.run, *args, **kwargs)
+        executor.shutdown(wait=False)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            if not future.cancel() and not future.done():
+                self.driver.interrupt()
+            raise
+
+
+class FactEncoding:
+    """
+    A dictionary of integer ids for the names, values and paths in facts.
+
+    Each distinct symbol (by symbol_key, so 1 and "1" differ) gets an id, so
+    the solver stores small numbers instead of long strings. This only works
+    for logic programs that compare these for (in)equality, like the default
+    programs, and every number in an answer is decoded as an id.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.values = []
+
+    def __len__(self):
+        return len(self.values)
+
+    def encode(self, value):
+        """
+        Return the id for a value, adding it if we have not seen it.
+        """
+        key = symbol_key(value)
+        idx = self.ids.get(key)
+        if idx is None:
+            idx = self.ids[key] = len(self.values)
+
+            # The string the answer would have had without the encoding
+            self.values.append(str(value))
+        return idx
+
+    def decode(self, symbol):
+        """
+        Return the string for an answer argument, decoding ids.
+        """
+        if symbol.type == clingo.SymbolType.Number and 0 <= symbol.number < len(
+            self.values
+        ):
+            return self.values[symbol.number]
+        return compspec.solver.stringify(symbol)
+
+    def encode_facts(self, facts):
+        """
+        Encode the names, values and paths in (name, arguments) facts.
+        """
+        encode = self.encode
+        for name, arguments in facts:
+            if name == "node":
+                nodeid, nodename, value, path = arguments
+                arguments = (nodeid, encode(nodename), encode(value), encode(path))
+            elif name == "path":
+                arguments = (encode(arguments[0]),)
+            yield name, arguments
 
 
 class FactGenerator:
@@ -62,14 +254,38 @@ class FactGenerator:
     The FactGenerator generates facts for one graph.
     """
 
-    def generate_facts(self, g, ns):
+    # A FactEncoding, if names, values and paths are encoded as integers
+    encoding = None
+
+    def fingerprint(self):
+        """
+        Return fields (namespaces and graph fingerprints) that identify the facts.
+        """
+        raise NotImplementedError
+
+    def generate_facts(self, g, ns, skip=None):
+        """
+        Generate facts for a namespaced graph, optionally skipping node ids
+        """
+        facts = self.iter_facts(g, skip)
+        if self.encoding is not None:
+            facts = self.encoding.encode_facts(facts)
+        self.gen.facts(facts, prefix=(ns,))
+
+    def iter_facts(self, g, skip=None):
         """
-        Generate facts for a namespaced graph
+        Yield (name, arguments) for the facts about a graph.
         """
         for relation in g.iter_relations():
-            self.gen.fact(fn.relation(ns, *relation))
+            if skip and (relation[0] in skip or relation[2] in skip):
+                continue
+            yield "relation", relation
         for node in g.iter_connectors():
-            self.gen.fact(fn.is_connector(ns, node))
+            if skip and node in skip:
+                continue
+            yield "is_connector", (node,)
         for node in g.iter_nodes():
-            self.gen.fact(fn.node(ns, *node))
-            self.gen.fact(fn.path(ns, node[-1]))
+            if skip and node[0] in skip:
+                continue
+            yield "node", node
+            yield "path", (node[-1],)
@@ -0,0 +1,81 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2022-2024, Vanessa Sochat"
+__license__ = "MIT"
+
+import collections
+import concurrent.futures
+import itertools
+import os
+
+from compspec.binary import pack_graph, unpack_view
+from compspec.logger import logger
+
+from .diff import Difference
+
+
+def run_diff(index, packedA, packedB, logic_programs, timeout, kwargs):
+    """
+    Run one diff in a worker, returning the index and the result.
+    """
+    diff = Difference(unpack_view(packedA), unpack_view(packedB), quiet=True, **kwargs)
+    diff.run(logic_programs, timeout=timeout)
+    result = diff.result
+
+    # Cores are clingo symbols, which we can't send back
+    result.cores = [[str(symbol) for symbol in core] for core in result.cores]
+    return index, result
+
+
+def batch_diff(pairs, workers=None, logic_programs=None, timeout=None, **kwargs):
+    """
+    Run a Difference for each (A, B) pair of graphs over a process pool.
+
+    Results are yielded as (index, result) as each diff completes, where the
+    index is the position of the pair, and result.answers is what run would
+    return. Other keyword arguments (e.g., prune, engine or profile) are passed
+    to each Difference. Each worker solves with one thread unless threads
+    is set. A graph used in several pairs (e.g., a reference library) is
+    only packed once, and we only have a few pairs per worker in flight, so
+    pairs can be a generator.
+    """
+    kwargs.setdefault("threads", 1)
+    workers = workers or os.cpu_count() or 1
+    limit = workers * 2
+
+    # Recently packed graphs (we keep the graph so the id is not reused)
+    packed = collections.OrderedDict()
+
+    def pack(g):
+        key = id(g)
+        if key not in packed:
+            packed[key] = (g, pack_graph(g))
+            if len(packed) > limit * 2:
+                packed.popitem(last=False)
+        packed.move_to_end(key)
+        return packed[key][1]
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        pairs = enumerate(pairs)
+        running = set()
+        while True:
+            for index, (A, B) in itertools.islice(pairs, limit - len(running)):
+                running.add(
+                    executor.submit(
+                        run_diff,
+                        index,
+                        pack(A),
+                        pack(B),
+                        logic_programs,
+                        timeout,
+                        kwargs,
+                    )
+                )
+            if not running:
+                break
+            done, running = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                index, result = future.result()
+                logger.debug(f"Finished diff {index}")
+                yield index, result
@@ -2,10 +2,9 @@ __author__ = "Vanessa Sochat"
 __copyright__ = "Copyright 2022-2024, Vanessa Sochat"
 __license__ = "MIT"
 
-import compspec.solver
 from compspec.solver import fn
 
-from .base import CompositionBase, FactGenerator
+from .base import CompositionBase, FactEncoding, FactGenerator
 
 
 class Combination(CompositionBase):
@@ -13,9 +12,22 @@ class Combination(CompositionBase):
     A combination combines one or more graphs.
     """
 
-    def __init__(self, out=None, quiet=False):
-        self.driver = compspec.solver.PyclingoDriver(out=out)
+    def __init__(
+        self,
+        out=None,
+        quiet=False,
+        driver=None,
+        profile=None,
+        threads=None,
+        ground_only=None,
+        cache=None,
+        encode=False,
+    ):
+        self.set_driver(driver, profile, threads, ground_only)
+        self.cache = cache
         self.facts = CombinedFactsGenerator()
+        if encode:
+            self.facts.encoding = FactEncoding()
         self.set_verbosity(out, quiet)
 
     def add_graph(self, g, ns):
@@ -40,6 +52,12 @@ class CombinedFactsGenerator(FactGenerator):
         """
         self.graphs[ns] = g
 
+    def fingerprint(self):
+        fields = []
+        for ns, g in self.graphs.items():
+            fields += [ns, g.fingerprint()]
+        return fields
+
     def setup(self, driver):
         self.gen = driver
         for ns, g in self.graphs.items():
@@ -2,10 +2,9 @@ __author__ = "Vanessa Sochat"
 __copyright__ = "Copyright 2022-2024, Vanessa Sochat"
 __license__ = "MIT"
 
-import compspec.solver
 from compspec.solver import fn
 
-from .base import CompositionBase, FactGenerator
+from .base import CompositionBase, FactEncoding, FactGenerator
 
 
 class Composition(CompositionBase):
@@ -15,9 +14,24 @@ class Composition(CompositionBase):
     extra logic program (unless the user requests it).
     """
 
-    def __init__(self, g, out=None, namespace=None, quiet=False):
-        self.driver = compspec.solver.PyclingoDriver(out=out)
+    def __init__(
+        self,
+        g,
+        out=None,
+        namespace=None,
+        quiet=False,
+        driver=None,
+        profile=None,
+        threads=None,
+        ground_only=None,
+        cache=None,
+        encode=False,
+    ):
+        self.set_driver(driver, profile, threads, ground_only)
+        self.cache = cache
         self.facts = SingleCorpusGenerator(g, namespace=namespace)
+        if encode:
+            self.facts.encoding = FactEncoding()
         self.set_verbosity(out, quiet)
 
 
@@ -30,6 +44,9 @@ class SingleCorpusGenerator(FactGenerator):
         self.g = g
         self.ns = namespace or "A"
 
+    def fingerprint(self):
+        return [self.ns, self.g.fingerprint()]
+
     def setup(self, driver):
         """
         Setup data for one library.
@@ -2,11 +2,16 @@ __author__ = "Vanessa Sochat"
 __copyright__ = "Copyright 2022, Vanessa Sochat"
 __license__ = "MPL 2.0"
 
-import compspec.solver
+import compspec.asp.lp as lp
 import compspec.utils as utils
+from compspec.logger import logger
 from compspec.solver import fn
 
-from .base import CompositionBase, FactGenerator
+from .base import CompositionBase, FactEncoding, FactGenerator
+from .native import NativeDiff
+
+# Engines that can run the default logic program (is-compatible.lp)
+engines = ["clingo", "native"]
 
 
 class Difference(CompositionBase):
@@ -18,13 +23,52 @@ class Difference(CompositionBase):
 
     _logic_programs = ["is-compatible.lp"]
 
-    def __init__(self, A, B, namespaceA=None, namespaceB=None, out=None, quiet=False):
-        self.driver = compspec.solver.PyclingoDriver(out=out)
+    def __init__(
+        self,
+        A,
+        B,
+        namespaceA=None,
+        namespaceB=None,
+        out=None,
+        quiet=False,
+        prune=False,
+        engine="clingo",
+        driver=None,
+        profile=None,
+        threads=None,
+        ground_only=None,
+        cache=None,
+        encode=False,
+    ):
+        if engine not in engines:
+            raise ValueError(f"Engine {engine} is not known, choices are {engines}")
+        self.engine = engine
+        self.set_driver(driver, profile, threads, ground_only)
+        self.cache = cache
         self.facts = DiffFactsGenerator(
-            A, B, namespaceA=namespaceA, namespaceB=namespaceB
+            A, B, namespaceA=namespaceA, namespaceB=namespaceB, prune=prune
         )
+        if encode:
+            self.facts.encoding = FactEncoding()
         self.set_verbosity(out, quiet)
 
+    def solve(self, logic_programs=None, nmodels=None, timeout=None):
+        """
+        Run the solve, using the native engine if it is selected and we are
+        only running the default logic program. The native engine has no
+        search to stop, so it ignores the timeout.
+        """
+        if self.engine == "native":
+            if logic_programs == lp.get_facts(list(self._logic_programs)):
+                result = self.result = self.facts.native()
+                if result.answers:
+                    result.answers = self.prepare_result(result.answers)
+                return result.answers
+            logger.warning(
+                "The native engine only supports the default logic program, using clingo."
+            )
+        return super().solve(logic_programs, nmodels, timeout)
+
     @classmethod
     def table(cls, result):
         """
@@ -70,16 +114,94 @@ class Difference(CompositionBase):
         return result
 
 
+def identical_subtrees(A, B):
+    """
+    Find node ids in subtrees that are identical between graphs A and B.
+
+    A node can be pruned from both graphs when it has the same id, path and
+    subtree hash in each, and every child can be pruned too. The default
+    logic program also compares nodes by path across the whole graph, so
+    we keep any node that shares a path with a node we are not pruning.
+    The nodes that are left give the same result as the full graphs.
+    """
+    hashesA = A.subtree_hashes()
+    hashesB = B.subtree_hashes()
+    pathsA = {node[0]: node[-1] for node in A.iter_nodes()}
+    pathsB = {node[0]: node[-1] for node in B.iter_nodes()}
+    candidates = {
+        nodeid
+        for nodeid, digest in hashesA.items()
+        if hashesB.get(nodeid) == digest and pathsA[nodeid] == pathsB[nodeid]
+    }
+
+    # Children and parents by node id, across both graphs
+    children = {}
+    parents = {}
+    for g in A, B:
+        for fromid, toids in g._adjacency().items():
+            for _, toid in toids:
+                children.setdefault(fromid, set()).add(toid)
+                parents.setdefault(toid, set()).add(fromid)
+
+    kept_paths = {path for nodeid, path in pathsA.items() if nodeid not in candidates}
+    kept_paths.update(
+        path for nodeid, path in pathsB.items() if nodeid not in candidates
+    )
+    by_path = {}
+    for nodeid in candidates:
+        by_path.setdefault(pathsA[nodeid], set()).add(nodeid)
+
+    # Remove candidates with a kept child or path, and propagate up
+    queue = [
+        nodeid
+        for nodeid in candidates
+        if pathsA[nodeid] in kept_paths
+        or any(child not in candidates for child in children.get(nodeid, []))
+    ]
+    while queue:
+        nodeid = queue.pop()
+        if nodeid not in candidates:
+            continue
+        candidates.discard(nodeid)
+        path = pathsA[nodeid]
+        if path not in kept_paths:
+            kept_paths.add(path)
+            queue.extend(by_path[path])
+        queue.extend(parents.get(nodeid, []))
+    return candidates
+
+
 class DiffFactsGenerator(FactGenerator):
     """
     The DiffFactsGenerator generates facts for two graphs to compare.
     """
 
-    def __init__(self, A, B, namespaceA=None, namespaceB=None):
+    def __init__(self, A, B, namespaceA=None, namespaceB=None, prune=False):
         self.A = A
         self.B = B
         self.nsA = namespaceA or "A"
         self.nsB = namespaceB or "B"
+        self.prune = prune
+
+    def fingerprint(self):
+        return [self.nsA, self.nsB, self.A.fingerprint(), self.B.fingerprint()]
+
+    def pruned(self):
+        """
+        Return node ids in identical subtrees to skip, if we are pruning.
+        """
+        if not self.prune:
+            return
+        skip = identical_subtrees(self.A, self.B)
+        logger.debug(f"Pruning {len(skip)} nodes in identical subtrees")
+        return skip
+
+    def native(self):
+        """
+        Run the diff with the native engine instead of the solver.
+        """
+        diff = NativeDiff(self.A, self.B, self.nsA, self.nsB, skip=self.pruned())
+        return diff.solve()
 
     def setup(self, driver):
         """
@@ -92,6 +214,8 @@ class DiffFactsGenerator(FactGenerator):
         # Set the library namespace
         self.gen.fact(fn.is_a(self.nsA))
         self.gen.fact(fn.is_b(self.nsB))
+        # Identical subtrees can be dropped before facts reach the solver
+        skip = self.pruned()
         self.gen.h2(f"Namespace {self.nsA}")
-        self.generate_facts(self.A, self.nsA)
-        self.generate_facts(self.B, self.nsB)
+        self.generate_facts(self.A, self.nsA, skip=skip)
+        self.generate_facts(self.B, self.nsB, skip=skip)
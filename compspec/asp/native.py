@@ -0,0 +1,230 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2022-2024, Vanessa Sochat"
+__license__ = "MIT"
+
+# A native (Python) implementation of the shown relations in is-compatible.lp
+# Nodes are joined on hashed keys instead of grounding rules across every
+# pair of same-named nodes, so the work here is linear in the graph size.
+
+import time
+
+import compspec.solver
+from compspec.graph import symbol_key
+
+
+class GraphIndex:
+    """
+    The facts for one namespaced graph, indexed for the diff.
+
+    Node ids, names, values and paths are compared by symbol_key, so they
+    are equal here when the ASP symbols would be.
+    """
+
+    def __init__(self, g, skip=None):
+        self.nodes = {}
+        self.connectors = set()
+        self.paths = set()
+        self.contents = set()
+
+        for node in g.iter_nodes():
+            if skip and node[0] in skip:
+                continue
+            nodeid, name, value, path = node
+            key = symbol_key(nodeid)
+            name, value, path = symbol_key(name), symbol_key(value), symbol_key(path)
+            self.nodes[key] = (node, name, value, path)
+            self.paths.add(path)
+            self.contents.add((name, value, path))
+
+        for nodeid in g.iter_connectors():
+            self.connectors.add(symbol_key(nodeid))
+
+        # A parent relation requires both nodes to exist (is_parent)
+        self.parents = {}
+        for fromid, relation, toid in g.iter_relations():
+            fromid, toid = symbol_key(fromid), symbol_key(toid)
+            if fromid not in self.nodes or toid not in self.nodes:
+                continue
+            if toid not in self.parents:
+                self.parents[toid] = set()
+            self.parents[toid].add((fromid, symbol_key(relation)))
+
+    def parent_names(self, key):
+        """
+        Return the set of (parent name, relation) for a node.
+        """
+        return {
+            (self.nodes[parent][1], relation)
+            for parent, relation in self.parents.get(key, [])
+        }
+
+
+class NativeDiff:
+    """
+    Compute added_node, removed_node and changed_node_value for two graphs.
+
+    A node has changed when it has the same id and name in A and B, a parent
+    with the same name and relation in each, and a different value and path.
+    Changes below a changed node are attributed to the changed parent
+    (changed_parent), which we track as a bit mask of the distances at
+    which a node has a changed ancestor. Graphs are expected to be acyclic.
+    """
+
+    def __init__(self, A, B, namespaceA="A", namespaceB="B", skip=None):
+        self.nsA = namespaceA
+        self.nsB = namespaceB
+        start = time.perf_counter()
+        self.A = GraphIndex(A, skip=skip)
+        self.B = GraphIndex(B, skip=skip)
+        self.timings = {"setup": time.perf_counter() - start}
+
+    def solve(self):
+        """
+        Run the diff, returning a Result with answers like the clingo solve.
+        """
+        began = time.perf_counter()
+        A, B = self.A, self.B
+        changed = set()
+        distancesA = {}
+        distancesB = {}
+
+        def distances(index, key, lookup):
+            mask = 0
+            for parent, _ in index.parents.get(key, []):
+                mask |= lookup.get(parent, 0) << 1
+                if parent in changed:
+                    mask |= 1
+            return mask
+
+        # Visit parents (in either graph) before children
+        done = set()
+        for start in list(A.nodes) + list(B.nodes):
+            stack = [(start, False)]
+            while stack:
+                key, expanded = stack.pop()
+                if not expanded:
+                    if key in done:
+                        continue
+                    done.add(key)
+                    stack.append((key, True))
+                    for index in A, B:
+                        for parent, _ in index.parents.get(key, []):
+                            if parent not in done:
+                                stack.append((parent, False))
+                    continue
+
+                # We only get here once all parents are done
+                if key in A.nodes:
+                    distancesA[key] = distances(A, key, distancesA)
+                if key in B.nodes:
+                    distancesB[key] = distances(B, key, distancesB)
+                if self.is_changed(key, distancesA, distancesB):
+                    changed.add(key)
+
+        result = self.result(changed, distancesA, distancesB)
+        result.timings = dict(self.timings, solve=time.perf_counter() - began)
+        return result
+
+    def is_changed(self, key, distancesA, distancesB):
+        """
+        Determine if a node has a changed value (changed_node_value)
+        """
+        if key not in self.A.nodes or key not in self.B.nodes:
+            return False
+        if key in self.A.connectors or key in self.B.connectors:
+            return False
+        _, nameA, valueA, pathA = self.A.nodes[key]
+        _, nameB, valueB, pathB = self.B.nodes[key]
+        if nameA != nameB or valueA == valueB or pathA == pathB:
+            return False
+
+        # Changed parents (at the same distance) take precedence
+        if distancesA[key] & distancesB[key]:
+            return False
+        return bool(self.A.parent_names(key) & self.B.parent_names(key))
+
+    def result(self, changed, distancesA, distancesB):
+        """
+        Derive the shown relations, given the changed nodes.
+        """
+        A, B = self.A, self.B
+        answers = {"added_node": [], "removed_node": [], "changed_node_value": []}
+
+        # Is there a changed parent at any distance in the other graph?
+        anyA = 0
+        for mask in distancesA.values():
+            anyA |= mask
+        anyB = 0
+        for mask in distancesB.values():
+            anyB |= mask
+
+        # Names and paths for changes, matched by negation in removed and added
+        changed_paths = set()
+        changed_names = set()
+        for key in changed:
+            nodeA, name, _, pathA = A.nodes[key]
+            nodeB, _, _, pathB = B.nodes[key]
+            changed_paths.update([pathA, pathB])
+            changed_names.update([(name, pathA), (name, pathB)])
+            answers["changed_node_value"].append(
+                [
+                    self.nsA,
+                    self.nsB,
+                    nodeA[0],
+                    nodeB[0],
+                    nodeA[1],
+                    nodeA[2],
+                    nodeB[2],
+                    nodeA[3],
+                    nodeB[3],
+                ]
+            )
+
+        for key, (node, name, value, path) in A.nodes.items():
+            if key in A.connectors or path in B.paths:
+                continue
+
+            # This covers top level cases (no parents)
+            if (
+                (name, value, path) not in B.contents
+                and (name, path) not in changed_names
+                and not distancesA[key] & anyB
+            ):
+                answers["removed_node"].append(
+                    [self.nsA, self.nsB, node[0], node[1], node[2], node[3]]
+                )
+
+            # And the same node id in B with a different name and shared parent
+            if (
+                key in B.nodes
+                and B.nodes[key][1] != name
+                and path not in changed_paths
+                and not distancesA[key] & distancesB[key]
+                and A.parent_names(key) & B.parent_names(key)
+            ):
+                answers["removed_node"].append(
+                    [self.nsA, self.nsB, node[0], node[1], node[3]]
+                )
+
+        for key, (node, name, value, path) in B.nodes.items():
+            if key in B.connectors or path in A.paths:
+                continue
+            if (
+                (name, value, path) not in A.contents
+                and (name, path) not in changed_names
+                and not distancesB[key] & anyA
+            ):
+                answers["added_node"].append(
+                    [self.nsA, self.nsB, node[0], node[1], node[2], node[3]]
+                )
+
+        # Like a model, we only include relations that are present
+        result = compspec.solver.Result()
+        result.satisfiable = True
+        result.nmodels = 1
+        result.answers = {
+            name: [[str(arg) for arg in entry] for entry in entries]
+            for name, entries in answers.items()
+            if entries
+        }
+        return result
@@ -0,0 +1,306 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2022-2024, Vanessa Sochat"
+__license__ = "MIT"
+
+import time
+
+import compspec.graph
+import compspec.solver
+from compspec.graph import GraphView, value_key
+from compspec.logger import logger
+
+from .base import FactEncoding
+from .diff import Difference, DiffFactsGenerator
+
+
+def text_values(text):
+    """
+    Return the values (of the types we write) that are written as text.
+    """
+    values = [text]
+    for kind in int, float:
+        try:
+            value = kind(text)
+        except ValueError:
+            continue
+        if str(value) == text:
+            values.append(value)
+    if text in ("True", "False"):
+        values.append(text == "True")
+    return values
+
+
+class StagedGraph:
+    """
+    A graph that a staged difference walks level by level.
+
+    Nodes, children and parents are read from the graph's own indices (its
+    nodes and query index), so we only keep the subtree hashes and roots.
+    """
+
+    def __init__(self, g):
+        self.nodes = g.nodes
+        self.path = g.path
+        self.index = g.query_index()
+        self.hashes = g.subtree_hashes()
+        self.roots = [x for x in self.nodes if not self.parents_of(x)]
+
+    def children_of(self, nodeid):
+        return [x for x in self.index.children.get(nodeid, []) if x[1] in self.nodes]
+
+    def parents_of(self, nodeid):
+        return [x for x in self.index.parents.get(nodeid, []) if x[1] in self.nodes]
+
+    def moved(self, other):
+        """
+        Determine if a node is at another depth in the other graph (a subtree
+        that moved, or ids that were renumbered).
+        """
+        separator = compspec.graph.PathTrie.separator
+        for nodeid in self.nodes:
+            if nodeid in other.nodes:
+                if self.path(nodeid).count(separator) != other.path(nodeid).count(
+                    separator
+                ):
+                    return True
+        return False
+
+    def node(self, nodeid):
+        """
+        Return the fact for a node, with the path as the last argument.
+        """
+        return self.nodes[nodeid].args + (self.path(nodeid),)
+
+    def with_path(self, name, text, path):
+        """
+        Return the ids of nodes with a path, which ends with the name and
+        value (as text) of the node.
+        """
+        found = []
+        for value in text_values(text):
+            for nodeid in self.index.values.get((name, value_key(value)), []):
+                if self.path(nodeid) == path:
+                    found.append(nodeid)
+        return found
+
+    def window(self, top, levels):
+        """
+        Return the nodes and relations for the top nodes and up to N levels
+        below them, the nodes on the bottom level, and the nodes below the top.
+
+        The window also has every ancestor of the top nodes, so a change above
+        them (a changed parent) is known to the logic program.
+        """
+        nodes = set(top)
+        level = list(top)
+        relations = []
+        for _ in range(levels):
+            below = []
+            for nodeid in level:
+                for relation, child in self.children_of(nodeid):
+                    relations.append((nodeid, relation, child))
+                    if child not in nodes:
+                        nodes.add(child)
+                        below.append(child)
+            level = below
+            if not below:
+                break
+        fresh = nodes.difference(top)
+        self.ancestors(top, nodes, relations)
+        return (nodes, relations), level, fresh
+
+    def ancestors(self, ids, nodes, relations):
+        """
+        Add the ancestors of some nodes (and the relations to them) to a window.
+        """
+        stack = list(ids)
+        while stack:
+            nodeid = stack.pop()
+            for relation, parent in self.parents_of(nodeid):
+                relations.append((parent, relation, nodeid))
+                if parent not in nodes:
+                    nodes.add(parent)
+                    stack.append(parent)
+
+    def view(self, window, ids, paths):
+        """
+        Return a view of a window, with context from the rest of the graph.
+
+        The logic program compares nodes across graphs by id, so we add the
+        nodes (and their ancestors) with the ids new to the stage in either
+        graph. It also looks for a path anywhere in a graph, so we add the
+        nodes with a path new to the stage too (paths are (name, value as
+        text, path) for the last node on each).
+        """
+        nodes, relations = window
+        nodes = set(nodes)
+        relations = list(relations)
+        ids = [x for x in ids if x in self.nodes and x not in nodes]
+        nodes.update(ids)
+        self.ancestors(ids, nodes, relations)
+        for path in paths:
+            nodes.update(self.with_path(*path))
+        return GraphView(
+            [self.node(x) for x in nodes],
+            list(dict.fromkeys(relations)),
+            [x for x in nodes if self.nodes[x].is_connector],
+        )
+
+    def under(self, nodeid, changed):
+        """
+        Determine if a node is (or is below) a node with a changed value.
+        """
+        stack = [nodeid]
+        visited = set()
+        while stack:
+            nodeid = stack.pop()
+            if nodeid in changed:
+                return True
+            if nodeid not in visited:
+                visited.add(nodeid)
+                stack.extend(parent for _, parent in self.parents_of(nodeid))
+        return False
+
+
+class StagedDifference(Difference):
+    """
+    A staged difference compares the top levels of two graphs first, and
+    then only descends into subtrees that differ. We stop at subtrees that
+    are identical in both graphs (the same id, path and subtree hash),
+    unless they are below a node with a changed value, as is-compatible.lp
+    pairs the nodes at each depth below a changed parent.
+
+    Each stage is a small solve (or native comparison) on a window of the
+    graphs, so we never hold every fact in one solver. A window has the
+    context that the logic program needs for the nodes new to it: their
+    ancestors, the nodes with the same ids in the other graph, and the
+    nodes with the same paths. For the default logic program it gives the
+    same result as a Difference. is-compatible.lp also pairs nodes below two
+    changed nodes at different depths (e.g., a subtree that moved and
+    changed), and that pairing can span stages, so if a node id is at
+    another depth in each graph we solve the graphs in one stage instead.
+    Other logic programs only see the nodes in each window.
+    """
+
+    def __init__(self, A, B, namespaceA=None, namespaceB=None, levels=2, **kwargs):
+        super().__init__(A, B, namespaceA=namespaceA, namespaceB=namespaceB, **kwargs)
+        if levels < 1:
+            raise ValueError("A staged difference needs at least one level per stage.")
+        self.levels = levels
+        self.stages = 0
+
+    def solve(self, logic_programs=None, nmodels=None, timeout=None):
+        """
+        Run the diff in stages, merging the answers from each.
+
+        The timeout is shared by the stages, and if one is interrupted we
+        stop with the answers so far.
+        """
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        A = StagedGraph(self.facts.A)
+        B = StagedGraph(self.facts.B)
+        if A.moved(B):
+            logger.debug("A node moved between graphs, solving in one stage")
+            self.stages = 1
+            return super().solve(logic_programs, nmodels, timeout)
+
+        answers = {}
+        seen = set()
+        changed = set()
+        timings = {}
+        interrupted = False
+
+        def is_identical(nodeid):
+            return (
+                nodeid in A.nodes
+                and nodeid in B.nodes
+                and A.path(nodeid) == B.path(nodeid)
+                and A.hashes[nodeid] == B.hashes[nodeid]
+            )
+
+        # A removed node is in A, an added node is in B, and a change is in both
+        def is_fresh(name, entry):
+            if name == "removed_node":
+                return entry[2] in freshA
+            if name == "added_node":
+                return entry[2] in freshB
+            if name == "changed_node_value":
+                return entry[2] in freshA or entry[3] in freshB
+            return entry[2] in freshA or entry[2] in freshB
+
+        # The first stage covers the roots and the levels below them
+        windowA, bottomA, freshA = A.window(A.roots, self.levels - 1)
+        windowB, bottomB, freshB = B.window(B.roots, self.levels - 1)
+        freshA.update(A.roots)
+        freshB.update(B.roots)
+        self.stages = 0
+        while True:
+            self.stages += 1
+            fresh = freshA | freshB
+            paths = {
+                (g.nodes[x].name, str(g.nodes[x].value), g.path(x))
+                for g in (A, B)
+                for x in fresh
+                if x in g.nodes
+            }
+            viewA = A.view(windowA, fresh, paths)
+            viewB = B.view(windowB, fresh, paths)
+            stage = DiffFactsGenerator(
+                viewA, viewB, self.facts.nsA, self.facts.nsB, prune=self.facts.prune
+            )
+            if self.facts.encoding is not None:
+                stage.encoding = FactEncoding()
+
+            # We only keep answers for the nodes new to this stage, as the top
+            # nodes (and their ancestors) were assessed in an earlier one
+            remaining = None
+            if deadline is not None:
+                remaining = max(0.0, deadline - time.perf_counter())
+            stage_answers = self.solve_stage(stage, logic_programs, nmodels, remaining)
+            for phase, seconds in self.result.timings.items():
+                timings[phase] = timings.get(phase, 0.0) + seconds
+            for name, entries in stage_answers.items():
+                for entry in entries:
+                    if not is_fresh(name, entry) or (name, tuple(entry)) in seen:
+                        continue
+                    seen.add((name, tuple(entry)))
+                    answers.setdefault(name, []).append(entry)
+                    if name == "changed_node_value":
+                        changed.update(entry[2:4])
+
+            if self.result.interrupted:
+                interrupted = True
+                break
+
+            # Descend into subtrees that differ, and every subtree below a
+            # changed node (a changed parent pairs nodes at the same depth)
+            frontierA = [
+                x for x in bottomA if not is_identical(x) or A.under(x, changed)
+            ]
+            frontierB = [
+                x for x in bottomB if not is_identical(x) or B.under(x, changed)
+            ]
+            if not frontierA and not frontierB:
+                break
+            windowA, bottomA, freshA = A.window(frontierA, self.levels)
+            windowB, bottomB, freshB = B.window(frontierB, self.levels)
+
+        logger.debug(f"Staged difference finished in {self.stages} stages")
+        if answers:
+            answers = self.prepare_result(answers)
+        self.result = compspec.solver.Result()
+        self.result.satisfiable = True
+        self.result.interrupted = interrupted
+        self.result.timings = timings
+        self.result.answers = answers
+        return answers
+
+    def solve_stage(self, stage, logic_programs=None, nmodels=None, timeout=None):
+        """
+        Solve the facts for one stage, with our driver (and output).
+        """
+        facts, self.facts = self.facts, stage
+        try:
+            return super().solve(logic_programs, nmodels, timeout) or {}
+        finally:
+            self.facts = facts
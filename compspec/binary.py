@@ -0,0 +1,402 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2022-2024, Vanessa Sochat"
+__license__ = "MIT"
+
+# A compact binary format for graphs, with the facts in one string table
+# and integer arrays that can be memory-mapped and iterated in place.
+
+import array
+import json
+import mmap
+import struct
+import sys
+
+import compspec.entity as entity
+import compspec.graph
+from compspec.columnar import StringTable
+
+magic = b"CSPG"
+version = 1
+
+# Magic, version, byte order (1 is little endian) and number of sections,
+# followed by the (offset, length) of each section
+header = struct.Struct("<4sIII")
+directory = struct.Struct("<QQ")
+
+# Sections, in the order they are written
+sections = [
+    "value_offsets",
+    "value_tags",
+    "values",
+    "label_offsets",
+    "labels",
+    "trie_parents",
+    "trie_tails",
+    "nodes",
+    "relations",
+    "connectors",
+]
+
+# Types for values in the string table (other types are json)
+tags = {str: 0, int: 1, bool: 2, float: 3}
+
+
+def pack_graph(g):
+    """
+    Pack the facts for a graph (e.g., to send to a worker or write to disk).
+
+    Ids, names and values are interned in one table, and paths are split
+    into a trie so shared ancestry is stored once. Nodes, relations and
+    connectors are then arrays of indices, and we never pickle node objects.
+    A graph that already has a trie (a Graph or ColumnarGraph) sends it as is.
+    """
+    strings = StringTable()
+    intern = strings.intern
+    nodes = array.array("i")
+    paths = getattr(g, "paths", None)
+    if isinstance(paths, compspec.graph.PathTrie):
+        for nodeid, name, value, ref in g.iter_node_refs():
+            nodes.extend((intern(nodeid), intern(name), intern(value), ref))
+    else:
+        paths = compspec.graph.PathTrie()
+        refs = {"": -1}
+        for nodeid, name, value, path in g.iter_nodes():
+            ref = refs.get(path)
+            if ref is None:
+                ref = -1
+                for segment in path.split(paths.separator):
+                    ref = paths.add(segment, ref)
+                refs[path] = ref
+            nodes.extend((intern(nodeid), intern(name), intern(value), ref))
+    relations = array.array("i")
+    for relation in g.iter_relations():
+        relations.extend(intern(x) for x in relation)
+    connectors = array.array("i", (intern(x) for x in g.iter_connectors()))
+    return (
+        strings.values,
+        (paths.labels, paths.parents.tobytes(), paths.tails.tobytes()),
+        nodes.tobytes(),
+        relations.tobytes(),
+        connectors.tobytes(),
+    )
+
+
+def indices(data):
+    """
+    Return an integer array from packed bytes.
+    """
+    column = array.array("i")
+    column.frombytes(data)
+    return column
+
+
+def unpack_graph(packed):
+    """
+    Unpack a graph from pack_graph into a Graph, with the same paths.
+    """
+    values, (labels, parents, tails), nodes, relations, connectors = packed
+    g = compspec.graph.Graph()
+    g.paths = compspec.graph.PathTrie.from_arrays(
+        labels, indices(parents), indices(tails)
+    )
+    connectors = {values[i] for i in indices(connectors)}
+    columns = [iter(indices(nodes))] * 4
+    for nodeid, name, value, ref in zip(*columns):
+        nodeid = values[nodeid]
+        node = entity.node(
+            nodeid, values[name], values[value], is_connector=nodeid in connectors
+        )
+        g.add_node(node)
+        if ref != -1:
+            g.set_path_ref(nodeid, ref)
+    columns = [iter(indices(relations))] * 3
+    for fromid, relation, toid in zip(*columns):
+        g.append_relation(
+            entity.relation(
+                fromid=values[fromid], toid=values[toid], relation=values[relation]
+            )
+        )
+    return g
+
+
+def unpack_view(packed):
+    """
+    Unpack a graph from pack_graph into a read-only view, which is faster
+    to make when we only need to diff it.
+    """
+    values, (labels, parents, tails), nodes, relations, connectors = packed
+
+    # A parent is always added before its children, so we build in order
+    paths = []
+    for parent, label in zip(indices(parents), indices(tails)):
+        segment = labels[label]
+        paths.append(
+            segment
+            if parent == -1
+            else paths[parent] + compspec.graph.PathTrie.separator + segment
+        )
+
+    # A node without a path has -1, the last (empty) path
+    paths.append("")
+    columns = [iter(indices(nodes))] * 4
+    nodes = [
+        (values[nodeid], values[name], values[value], paths[ref])
+        for nodeid, name, value, ref in zip(*columns)
+    ]
+    columns = [iter(indices(relations))] * 3
+    relations = [tuple(values[i] for i in row) for row in zip(*columns)]
+    connectors = [values[i] for i in indices(connectors)]
+    return compspec.graph.GraphView(nodes, relations, connectors)
+
+
+def encode_strings(values, typed=True):
+    """
+    Encode values as (offsets, tags, blob) sections.
+    """
+    offsets = array.array("q", [0])
+    types = bytearray()
+    blob = bytearray()
+    for value in values:
+        tag = tags.get(value.__class__, 4) if typed else 0
+        if tag == 4:
+            text = json.dumps(value)
+        else:
+            text = str(value)
+        blob += text.encode("utf-8")
+        offsets.append(len(blob))
+        types.append(tag)
+    return offsets.tobytes(), bytes(types), bytes(blob)
+
+
+def save_graph(g, filename):
+    """
+    Write a graph (any graph with the fact iterators) to a binary file.
+    """
+    values, (labels, parents, tails), nodes, relations, connectors = pack_graph(g)
+    value_offsets, value_tags, value_blob = encode_strings(values)
+    label_offsets, _, label_blob = encode_strings(labels, typed=False)
+    data = [
+        value_offsets,
+        value_tags,
+        value_blob,
+        label_offsets,
+        label_blob,
+        parents,
+        tails,
+        nodes,
+        relations,
+        connectors,
+    ]
+
+    # Sections are aligned to 8 bytes, so they can be cast in place
+    offset = header.size + directory.size * len(data)
+    entries = []
+    for section in data:
+        offset += -offset % 8
+        entries.append((offset, len(section)))
+        offset += len(section)
+
+    byteorder = 1 if sys.byteorder == "little" else 2
+    with open(filename, "wb") as fd:
+        fd.write(header.pack(magic, version, byteorder, len(data)))
+        for entry in entries:
+            fd.write(directory.pack(*entry))
+        for (start, _), section in zip(entries, data):
+            fd.write(b"\0" * (start - fd.tell()))
+            fd.write(section)
+
+
+def is_binary(filename):
+    """
+    Determine if a file is a binary graph (by the magic at the start).
+    """
+    with open(filename, "rb") as fd:
+        return fd.read(len(magic)) == magic
+
+
+def load_graph(filename):
+    """
+    Load a binary graph file, memory-mapped.
+    """
+    return MappedGraph(filename)
+
+
+class MappedGraph(compspec.graph.ReadOnlyGraph):
+    """
+    A read-only graph backed by a memory-mapped binary file.
+
+    The integer arrays are used in place, so loading does not read the
+    graph. Values and path strings are decoded when they are first needed
+    (and kept), so iterating facts does not build node objects (unless
+    asked for with .nodes or .relations).
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as fd:
+            self.map = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+
+        found, fileversion, byteorder, count = header.unpack_from(self.map, 0)
+        if found != magic:
+            raise ValueError(f"{filename} is not a binary graph.")
+        if fileversion != version or count != len(sections):
+            raise ValueError(
+                f"{filename} is binary graph version {fileversion}, we support {version}."
+            )
+        swap = byteorder != (1 if sys.byteorder == "little" else 2)
+
+        self.views = []
+        self.sections = {}
+        for i, name in enumerate(sections):
+            start, length = directory.unpack_from(
+                self.map, header.size + i * directory.size
+            )
+            self.sections[name] = memoryview(self.map)[start : start + length]
+            self.views.append(self.sections[name])
+
+        def column(name, typecode):
+            # Arrays written on a machine with another byte order are copied
+            if swap:
+                values = array.array(typecode, self.sections[name].tobytes())
+                values.byteswap()
+                return values
+            view = self.sections[name].cast(typecode)
+            self.views.append(view)
+            return view
+
+        self._value_offsets = column("value_offsets", "q")
+        self._label_offsets = column("label_offsets", "q")
+        self._parents = column("trie_parents", "i")
+        self._tails = column("trie_tails", "i")
+        self._nodes = column("nodes", "i")
+        self._relations = column("relations", "i")
+        self._connectors = column("connectors", "i")
+
+        # Decoded values and paths, as they are needed
+        self._values = [None] * (len(self._value_offsets) - 1)
+        self._paths = [None] * len(self._parents)
+        self._ids = None
+
+    def __len__(self):
+        return len(self._nodes) // 4
+
+    def close(self):
+        """
+        Release the memory map.
+        """
+        for view in reversed(self.views):
+            view.release()
+        self.views = []
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def value(self, idx):
+        """
+        Decode a value from the string table.
+        """
+        value = self._values[idx]
+        if value is None:
+            start, end = self._value_offsets[idx], self._value_offsets[idx + 1]
+            text = str(self.sections["values"][start:end], "utf-8")
+            tag = self.sections["value_tags"][idx]
+            if tag == 0:
+                value = text
+            elif tag == 1:
+                value = int(text)
+            elif tag == 2:
+                value = text == "True"
+            elif tag == 3:
+                value = float(text)
+            else:
+                value = json.loads(text)
+            self._values[idx] = value
+        return value
+
+    def _path(self, ref):
+        """
+        Build the full path string for a trie reference.
+        """
+        if ref == -1:
+            return ""
+        path = self._paths[ref]
+        if path is not None:
+            return path
+
+        # Find the closest decoded ancestor, and build down from it
+        chain = []
+        while ref != -1 and self._paths[ref] is None:
+            chain.append(ref)
+            ref = self._parents[ref]
+        path = None if ref == -1 else self._paths[ref]
+        for ref in reversed(chain):
+            idx = self._tails[ref]
+            start, end = self._label_offsets[idx], self._label_offsets[idx + 1]
+            segment = str(self.sections["labels"][start:end], "utf-8")
+            path = (
+                segment
+                if path is None
+                else path + compspec.graph.PathTrie.separator + segment
+            )
+            self._paths[ref] = path
+        return path
+
+    def path(self, nodeid):
+        """
+        Return the full path string for a node (empty if it has no parent).
+        """
+        if self._ids is None:
+            self._ids = {
+                self.value(self._nodes[i]): self._nodes[i + 3]
+                for i in range(0, len(self._nodes), 4)
+            }
+        return self._path(self._ids.get(nodeid, -1))
+
+    def to_dict(self):
+        """
+        Output dictionary representation of nodes and relations.
+        """
+        return {
+            "nodes": [
+                entity.node(nodeid, name=name, value=value).to_dict()
+                for nodeid, name, value, _ in self.iter_nodes()
+            ],
+            "relations": [
+                entity.relation(fromid=fromid, toid=toid, relation=relation).to_dict()
+                for fromid, relation, toid in self.iter_relations()
+            ],
+        }
+
+    def iter_connectors(self):
+        """
+        Yield connector nodes only
+        """
+        for idx in self._connectors:
+            yield self.value(idx)
+
+    def iter_nodes(self):
+        """
+        Yield nodes, with the path as the last argument.
+        """
+        value = self.value
+        nodes = self._nodes
+        for i in range(0, len(nodes), 4):
+            yield (
+                value(nodes[i]),
+                value(nodes[i + 1]),
+                value(nodes[i + 2]),
+                self._path(nodes[i + 3]),
+            )
+
+    def iter_relations(self):
+        """
+        Yield relations in the same manner.
+        """
+        value = self.value
+        relations = self._relations
+        for i in range(0, len(relations), 3):
+            yield value(relations[i]), value(relations[i + 1]), value(relations[i + 2])
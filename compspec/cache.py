@@ -0,0 +1,360 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2022-2024, Vanessa Sochat"
+__license__ = "MIT"
+
+# On-disk caches of extracted graphs, keyed by the input they came from, so
+# checking the same libraries again skips parsing them, and of diff results.
+
+import collections
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import struct
+import tempfile
+
+import compspec.graph
+from compspec.binary import load_graph, save_graph
+from compspec.logger import logger
+from compspec.version import __version__
+
+default_cache = os.path.join("~", ".cache", "compspec")
+
+
+def elf_build_id(filename):
+    """
+    Return the GNU build-id of an ELF file as hex, or None if it has none.
+    """
+    if os.path.isdir(filename):
+        return None
+    with open(filename, "rb") as fd:
+        ident = fd.read(64)
+        if ident[:4] != b"\x7fELF" or len(ident) < 52:
+            return None
+        is64 = ident[4] == 2
+        endian = "<" if ident[5] == 1 else ">"
+        if is64:
+            (phoff,) = struct.unpack_from(endian + "Q", ident, 32)
+            phentsize, phnum = struct.unpack_from(endian + "HH", ident, 54)
+        else:
+            (phoff,) = struct.unpack_from(endian + "I", ident, 28)
+            phentsize, phnum = struct.unpack_from(endian + "HH", ident, 42)
+
+        # The build-id is a note (type 3, from GNU) in a PT_NOTE segment
+        for i in range(phnum):
+            fd.seek(phoff + i * phentsize)
+            header = fd.read(phentsize)
+            if is64:
+                ptype, _, offset = struct.unpack_from(endian + "IIQ", header)
+                size, _, align = struct.unpack_from(endian + "QQQ", header, 32)
+            else:
+                ptype, offset = struct.unpack_from(endian + "II", header)
+                size, _, _, align = struct.unpack_from(endian + "IIII", header, 16)
+            if ptype != 4:
+                continue
+            align = 8 if align == 8 else 4
+            fd.seek(offset)
+            notes = fd.read(size)
+            pos = 0
+            while pos + 12 <= len(notes):
+                namesz, descsz, ntype = struct.unpack_from(endian + "III", notes, pos)
+                pos += 12
+                name = notes[pos : pos + namesz]
+                pos += -(-namesz // align) * align
+                desc = notes[pos : pos + descsz]
+                pos += -(-descsz // align) * align
+                if ntype == 3 and name == b"GNU\0":
+                    return desc.hex()
+    return None
+
+
+def content_hash(filename):
+    """
+    Return the sha256 of a file's content.
+
+    For a directory, we hash the path (relative to it) and content hash of
+    every file under it, in sorted order.
+    """
+    h = hashlib.sha256()
+    if os.path.isdir(filename):
+        for root, dirs, files in os.walk(filename):
+            dirs.sort()
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                h.update(os.path.relpath(path, filename).encode("utf-8") + b"\0")
+                h.update(content_hash(path).encode("utf-8"))
+        return h.hexdigest()
+    with open(filename, "rb") as fd:
+        for chunk in iter(lambda: fd.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class CachedGraphs(compspec.graph.GraphGroup):
+    """
+    A graph group loaded from the cache. Each graph is mapped when first used.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        super().__init__()
+
+    def extract(self):
+        with open(os.path.join(self.path, "groups.json")) as fd:
+            names = json.load(fd)
+        for i, name in enumerate(names):
+            filename = os.path.join(self.path, f"{i}.cspg")
+            self.add_builder(name, lambda filename=filename: load_graph(filename))
+
+
+class DiskCache:
+    """
+    A directory of cache entries, evicted least recently used first once
+    the cache is larger than max_size (in bytes).
+
+    The default root is a subdirectory (name) of COMPSPEC_CACHE, or of
+    ~/.cache/compspec.
+    """
+
+    name = None
+
+    def __init__(self, root=None, max_size=4 * 1024**3):
+        if not root:
+            root = os.environ.get("COMPSPEC_CACHE") or default_cache
+            root = os.path.join(root, self.name)
+        self.root = os.path.abspath(os.path.expanduser(root))
+        self.max_size = max_size
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def entries(self):
+        """
+        Return (last used, size, path) for each entry in the cache.
+        """
+        entries = []
+        for name in os.listdir(self.root):
+            if name.startswith("."):
+                continue
+            path = os.path.join(self.root, name)
+            try:
+                if os.path.isdir(path):
+                    size = sum(
+                        os.path.getsize(os.path.join(path, x)) for x in os.listdir(path)
+                    )
+                else:
+                    size = os.path.getsize(path)
+                entries.append((os.path.getmtime(path), size, path))
+            except OSError:
+                continue
+        return entries
+
+    def remove(self, path):
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def evict(self, keep=None):
+        """
+        Remove the least recently used entries until we are under max_size.
+        """
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            if keep and os.path.basename(path).split(".")[0] == keep:
+                continue
+            logger.debug(f"Evicting {path} from {self.name} cache")
+            self.remove(path)
+            total -= size
+
+    def clear(self):
+        """
+        Remove every entry from the cache.
+        """
+        for _, _, path in self.entries():
+            self.remove(path)
+
+
+class GraphCache(DiskCache):
+    """
+    An on-disk cache of extracted graphs, in the binary graph format.
+
+    An entry is keyed by the input file (its ELF build-id if it has one, and
+    otherwise a hash of its content), the model class and the digest of the
+    file it is defined in, the compspec version, and any other arguments to
+    the model.
+    """
+
+    name = "graphs"
+
+    def key(self, model, filename, *args, **kwargs):
+        """
+        Derive the key for extracting a graph with model(filename, *args, **kwargs)
+        """
+        source = ""
+        try:
+            source = content_hash(inspect.getsourcefile(model))
+        except (OSError, TypeError):
+            pass
+        fields = [
+            f"{model.__module__}.{model.__qualname__}",
+            source,
+            __version__,
+            elf_build_id(filename) or content_hash(filename),
+            repr(args),
+            repr(sorted(kwargs.items())),
+        ]
+        return hashlib.sha256("\0".join(fields).encode("utf-8")).hexdigest()
+
+    def extract(self, model, filename, *args, **kwargs):
+        """
+        Return the graph (or graph group) from model(filename, *args, **kwargs),
+        from the cache if we have it.
+
+        A cached graph is a read-only MappedGraph, and a cached group holds
+        MappedGraphs. A group is extracted in full the first time, so every
+        graph in it can be cached.
+        """
+        key = self.key(model, filename, *args, **kwargs)
+        found = self.get(key)
+        if found is not None:
+            logger.debug(f"Found {filename} in graph cache {key}")
+            return found
+        extracted = model(filename, *args, **kwargs)
+        self.set(key, extracted)
+        return extracted
+
+    def get(self, key):
+        """
+        Get a cached graph or group by key, or None if we don't have it.
+        """
+        path = self.path(key)
+        if os.path.isdir(path):
+            found = CachedGraphs(path)
+        elif os.path.exists(path + ".cspg"):
+            path += ".cspg"
+            found = load_graph(path)
+        else:
+            return None
+
+        # The modified time is the last use, for eviction
+        os.utime(path)
+        return found
+
+    def set(self, key, extracted):
+        """
+        Save a graph or group to the cache, and evict old entries if needed.
+        """
+        # Entries are written to a temporary path and moved, so a reader
+        # never sees a partial entry
+        tmpdir = tempfile.mkdtemp(dir=self.root, prefix=".tmp-")
+        try:
+            if isinstance(extracted, compspec.graph.GraphGroup):
+                names = []
+                for name, g in extracted:
+                    save_graph(g, os.path.join(tmpdir, f"{len(names)}.cspg"))
+                    names.append(name)
+                with open(os.path.join(tmpdir, "groups.json"), "w") as fd:
+                    json.dump(names, fd)
+                os.replace(tmpdir, self.path(key))
+            else:
+                filename = os.path.join(tmpdir, "graph.cspg")
+                save_graph(extracted, filename)
+                os.replace(filename, self.path(key) + ".cspg")
+        except OSError as e:
+            # Another process may have written the same entry
+            logger.debug(f"Could not add {key} to graph cache: {e}")
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+        self.evict(keep=key)
+
+
+class ResultCache(DiskCache):
+    """
+    A cache of the answers from running a Composition, Combination or
+    Difference, kept as json in memory (up to max_entries) and, unless
+    disk is False, on disk.
+
+    An entry is keyed by the fingerprint of each graph, the namespaces and
+    other settings, and the digest of each logic program (see
+    CompositionBase.cache_key). Results from an interrupted search are not kept.
+    """
+
+    name = "results"
+
+    def __init__(self, root=None, max_size=256 * 1024**2, max_entries=256, disk=True):
+        self.memory = collections.OrderedDict()
+        self.max_entries = max_entries
+        self.disk = disk
+        if disk:
+            super().__init__(root, max_size)
+
+    def get(self, key):
+        """
+        Get a cached result (answers, satisfiable and nmodels) by key, or None.
+
+        Entries are kept as json, so each caller gets a new copy to change.
+        """
+        text = self.memory.get(key)
+        if text is not None:
+            self.memory.move_to_end(key)
+            return json.loads(text)
+        if not self.disk:
+            return None
+        path = self.path(key) + ".json"
+        try:
+            with open(path) as fd:
+                text = fd.read()
+            found = json.loads(text)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        self.remember(key, text)
+        return found
+
+    def remember(self, key, text):
+        self.memory[key] = text
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def set(self, key, result):
+        """
+        Save the answers for a result.
+        """
+        try:
+            text = json.dumps(
+                {
+                    "answers": result.answers,
+                    "satisfiable": result.satisfiable,
+                    "nmodels": result.nmodels,
+                }
+            )
+        except TypeError as e:
+            logger.debug(f"Could not add {key} to result cache: {e}")
+            return
+        self.remember(key, text)
+        if not self.disk:
+            return
+        fd, tmpfile = tempfile.mkstemp(dir=self.root, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "w") as out:
+                out.write(text)
+            os.replace(tmpfile, self.path(key) + ".json")
+        except OSError as e:
+            logger.debug(f"Could not add {key} to result cache: {e}")
+            self.remove(tmpfile)
+        self.evict(keep=key)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk:
+            super().clear()
@@ -10,6 +10,7 @@ import sys
 
 import compspec
 import compspec.plugin.parser as parsers
+import compspec.solver as solver
 from compspec.logger import setup_logger
 
 
@@ -70,9 +71,128 @@ def get_parser():
 
     # Add plugin parsers
     parsers.add_plugin_parsers(extractors)
+
+    # Compare two graphs
+    diff = subparsers.add_parser(
+        "diff",
+        formatter_class=argparse.RawTextHelpFormatter,
+        description="compare two graphs (saved as json nodes and relations, or binary)",
+    )
+    diff.add_argument("A", help="json or binary file for the first graph")
+    diff.add_argument("B", help="json or binary file for the second graph")
+    diff.add_argument("--outfile", help="output json file to write result")
+    diff.add_argument(
+        "--stats",
+        help="json file to write phase timings and solver statistics (- to print)",
+    )
+    diff.add_argument(
+        "--engine",
+        help="engine to run the diff (defaults to clingo)",
+        choices=["clingo", "native"],
+        default="clingo",
+    )
+    diff.add_argument(
+        "--prune",
+        help="drop subtrees that are identical in both graphs before the diff",
+        default=False,
+        action="store_true",
+    )
+    diff.add_argument(
+        "--table",
+        help="print the result as a table",
+        default=False,
+        action="store_true",
+    )
+    diff.add_argument(
+        "--timeout",
+        help="seconds to search before stopping with a partial result",
+        type=float,
+    )
+    diff.add_argument(
+        "--encode",
+        help="give the solver integer ids for names, values and paths (smaller for long paths)",
+        default=False,
+        action="store_true",
+    )
+    diff.add_argument(
+        "--ground-only",
+        help="skip the solve if grounding decides the answer (e.g., a stratified program)",
+        default=False,
+        action="store_true",
+    )
+    diff.add_argument(
+        "--cache",
+        help="cache results (under COMPSPEC_CACHE or ~/.cache/compspec) to reuse for the same graphs",
+        default=False,
+        action="store_true",
+    )
+    add_solver_arguments(diff)
+
+    # Time a fact set under each solver profile
+    bench = subparsers.add_parser(
+        "bench-solver",
+        formatter_class=argparse.RawTextHelpFormatter,
+        description="ground and solve logic programs under each solver profile",
+    )
+    bench.add_argument(
+        "programs",
+        help="facts (e.g., written by a diff, .gz is supported) and logic programs",
+        nargs="+",
+    )
+    bench.add_argument(
+        "--diff",
+        help="add is-compatible.lp (to time facts written by a diff)",
+        default=False,
+        action="store_true",
+    )
+    bench.add_argument(
+        "--profiles",
+        help="comma separated profiles to run (defaults to all)",
+    )
+    bench.add_argument(
+        "--repeat",
+        help="runs per profile (the best is kept)",
+        type=int,
+        default=1,
+    )
+    add_solver_arguments(bench, profile=False)
     return parser
 
 
+def threads_type(value):
+    """
+    A thread count, or auto to choose by the size of the ground program.
+    """
+    if value == "auto":
+        return value
+    try:
+        threads = int(value)
+    except ValueError:
+        threads = 0
+    if threads < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not a thread count or auto")
+    return threads
+
+
+def add_solver_arguments(parser, profile=True):
+    """
+    Add arguments to choose a solver profile and threads.
+    """
+    if profile:
+        parser.add_argument(
+            "--profile",
+            help="solver profile (defaults to default)",
+            choices=list(solver.profiles),
+            default="default",
+        )
+    parser.add_argument(
+        "--threads",
+        help="solver threads (defaults to %s), or auto to choose by problem size"
+        % solver.default_threads,
+        type=threads_type,
+    )
+
+
 def run_compspec():
     """
     run_compspec is the entrypoint for compspec!
@@ -117,6 +237,12 @@ def run_compspec():
     if args.command == "create":
         from .create import main
 
+    if args.command == "diff":
+        from .diff import main
+
+    if args.command == "bench-solver":
+        from .bench import main
+
     main(args, extra)
 
 
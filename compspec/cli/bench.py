@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2022-2024, Vanessa Sochat"
+__license__ = "MIT"
+
+import compspec.asp.lp as lp
+import compspec.solver as solver
+from compspec.logger import logger
+
+
+def main(args, extra):
+    """
+    Ground and solve a fact set under each solver profile, fastest first.
+    """
+    programs = list(args.programs)
+    if args.diff:
+        programs += lp.get_facts(["is-compatible.lp"])
+
+    names = None
+    if args.profiles:
+        names = [x.strip() for x in args.profiles.split(",") if x.strip()]
+        for name in names:
+            if name not in solver.profiles:
+                logger.exit(
+                    f"Solver profile {name} is not known, choices are {list(solver.profiles)}"
+                )
+
+    rows = solver.bench_profiles(
+        programs, names=names, threads=args.threads, repeat=args.repeat
+    )
+    print("| Profile | Threads | Satisfiable | Ground (s) | Solve (s) | Total (s) |")
+    print("|---------|---------|-------------|------------|-----------|-----------|")
+    for row in rows:
+        print(
+            "| %s | %s | %s | %.3f | %.3f | %.3f |"
+            % (
+                row["profile"],
+                row["threads"],
+                row["satisfiable"],
+                row["ground"],
+                row["solve"],
+                row["total"],
+            )
+        )
+    print(f"\nFastest profile: {rows[0]['profile']}")
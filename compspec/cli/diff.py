@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2022-2024, Vanessa Sochat"
+__license__ = "MIT"
+
+import json
+
+import compspec.utils as utils
+from compspec.asp import Difference
+from compspec.binary import is_binary, load_graph
+from compspec.cache import ResultCache
+from compspec.graph import Graph
+from compspec.logger import logger
+
+
+def load(filename):
+    """
+    Load a graph from a binary graph file, or json.
+    """
+    if is_binary(filename):
+        return load_graph(filename)
+    return Graph.from_dict(utils.read_json(filename))
+
+
+def main(args, extra):
+    """
+    Compare two graphs, optionally saving timings and solver statistics.
+    """
+    A = load(args.A)
+    B = load(args.B)
+    diff = Difference(
+        A,
+        B,
+        quiet=True,
+        prune=args.prune,
+        engine=args.engine,
+        profile=args.profile,
+        threads=args.threads,
+        ground_only=args.ground_only,
+        cache=ResultCache() if args.cache else None,
+        encode=args.encode,
+    )
+    result = diff.run(timeout=args.timeout)
+    if diff.result.interrupted:
+        logger.warning("The diff timed out, the result is partial.")
+
+    if args.table:
+        print(Difference.table(result))
+    elif args.outfile:
+        utils.write_json(result, args.outfile)
+    else:
+        print(json.dumps(result, indent=4))
+
+    if not args.stats:
+        return
+    stats = diff.result.to_dict()
+    if args.stats == "-":
+        print(json.dumps(stats, indent=4))
+    else:
+        utils.write_json(stats, args.stats)
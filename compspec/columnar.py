@@ -0,0 +1,586 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2022-2024, Vanessa Sochat"
+__license__ = "MIT"
+
+import array
+from collections.abc import Mapping
+
+import compspec.entity as entity
+import compspec.graph
+
+
+class StringTable:
+    """
+    A string table interns values (names, values, identifiers) so each
+    unique value is stored once and referenced by an integer index.
+
+    Strings are keyed directly, and other scalars are keyed with their type
+    so 1, True and "1" stay distinct (as they are distinct ASP symbols).
+    Unhashable values (e.g., lists) are stored without being deduplicated.
+    """
+
+    def __init__(self):
+        self.index = {}
+        self.values = []
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, idx):
+        return self.values[idx]
+
+    def __contains__(self, value):
+        return self.key(value) in self.index
+
+    @staticmethod
+    def key(value):
+        if isinstance(value, str):
+            return value
+        return (value.__class__, value)
+
+    def get(self, value, default=None):
+        """
+        Get the index of a value, if it has been interned.
+        """
+        try:
+            return self.index.get(self.key(value), default)
+        except TypeError:
+            return default
+
+    def intern(self, value):
+        """
+        Return the index for a value, adding it if we have not seen it.
+        """
+        # Most values are strings we have seen, so check those first
+        if value.__class__ is str:
+            idx = self.index.get(value)
+            if idx is not None:
+                return idx
+        try:
+            key = self.key(value)
+            idx = self.index.get(key)
+        except TypeError:
+            self.values.append(value)
+            return len(self.values) - 1
+        if idx is None:
+            idx = len(self.values)
+            self.index[key] = idx
+            self.values.append(value)
+        return idx
+
+
+class NodeIds:
+    """
+    Node ids by row.
+
+    Ids from a counter ("id0", "id1", ... in row order, as new_node makes
+    them) are not stored, as the row is in the id. The first id that is not
+    the next of these moves every id into a StringTable.
+    """
+
+    def __init__(self, prefix="id"):
+        self.prefix = prefix
+        self.count = 0
+        self.table = None
+
+    def __len__(self):
+        return self.count if self.table is None else len(self.table)
+
+    def __getitem__(self, row):
+        if self.table is not None:
+            return self.table[row]
+        if not 0 <= row < self.count:
+            raise IndexError(row)
+        return f"{self.prefix}{row}"
+
+    def __iter__(self):
+        if self.table is not None:
+            return iter(self.table.values)
+        prefix = self.prefix
+        return (f"{prefix}{row}" for row in range(self.count))
+
+    def __contains__(self, nodeid):
+        return self.get(nodeid) is not None
+
+    def get(self, nodeid, default=None):
+        """
+        Get the row for a node id, if we have it.
+        """
+        if self.table is not None:
+            return self.table.get(nodeid, default)
+
+        # A counter id has the row after the prefix, written the same way
+        try:
+            row = int(nodeid[len(self.prefix) :])
+        except (TypeError, ValueError):
+            return default
+        if row < 0 or row >= self.count or nodeid != f"{self.prefix}{row}":
+            return default
+        return row
+
+    def intern(self, nodeid):
+        """
+        Return the row for a node id, adding it if we have not seen it.
+        """
+        if self.table is None:
+            if nodeid == f"{self.prefix}{self.count}":
+                self.count += 1
+                return self.count - 1
+            row = self.get(nodeid)
+            if row is not None:
+                return row
+
+            # The ids are not from a counter, so we need to keep them
+            self.table = StringTable()
+            for row in range(self.count):
+                self.table.intern(f"{self.prefix}{row}")
+        return self.table.intern(nodeid)
+
+
+class CompactPathTrie(compspec.graph.PathTrie):
+    """
+    A PathTrie that finds a path by its parent and segment in a hash table
+    of array slots (open addressing), instead of a dict with a key and value
+    object for every path.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.children = None
+        self.slots = array.array("i", [-1]) * 16
+
+    @classmethod
+    def from_arrays(cls, labels, parents, tails):
+        trie = cls()
+        trie.labels = list(labels)
+        trie.segments = {segment: label for label, segment in enumerate(trie.labels)}
+        trie.parents = array.array("i", parents)
+        trie.tails = array.array("i", tails)
+        trie.resize()
+        return trie
+
+    def resize(self, extra=0):
+        """
+        Make the table at least twice the size of the trie (with room for
+        extra paths we are about to add), and fill it again.
+        """
+        size = 16
+        while size < 2 * (len(self.parents) + extra) + 2:
+            size *= 2
+        slots = array.array("i", [-1]) * size
+        mask = size - 1
+        for ref, (parent, label) in enumerate(zip(self.parents, self.tails)):
+            h = (((parent + 1) * 2654435761) ^ (label * 40503)) & mask
+            while slots[h] != -1:
+                h = (h + 1) & mask
+            slots[h] = ref
+        self.slots = slots
+
+    def child(self, parent, label):
+        """
+        Return the path reference for a label under a parent, adding it if needed.
+        """
+        slots = self.slots
+        parents = self.parents
+        tails = self.tails
+        mask = len(slots) - 1
+        h = (((parent + 1) * 2654435761) ^ (label * 40503)) & mask
+        ref = slots[h]
+        while ref != -1:
+            if parents[ref] == parent and tails[ref] == label:
+                return ref
+            h = (h + 1) & mask
+            ref = slots[h]
+        ref = len(parents)
+        parents.append(parent)
+        tails.append(label)
+        slots[h] = ref
+        if 2 * len(parents) > len(slots):
+            self.resize()
+        return ref
+
+
+class NodeView(Mapping):
+    """
+    A read-only mapping of node id to entity.node, generated on demand.
+
+    This lets code written for the dict-of-objects Graph (e.g., graph.nodes[nodeid])
+    work with a ColumnarGraph without storing the objects.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __getitem__(self, nodeid):
+        row = self.graph._ids.get(nodeid)
+        if row is None:
+            raise KeyError(nodeid)
+        return self.graph._node(row)
+
+    def __iter__(self):
+        return iter(self.graph._ids)
+
+    def __len__(self):
+        return len(self.graph._ids)
+
+
+class ColumnarGraph(compspec.graph.Graph):
+    """
+    A graph that stores nodes and relations in columns of typed arrays.
+
+    Node ids from the counter are not stored at all (the row is in the id),
+    and other ids are interned in their own table. Names, values and relation
+    types are interned in a shared string table, and paths are references
+    into a PathTrie that finds paths with array slots. A relation is found
+    by walking the relations into its node (one, for a tree), chained
+    through an array. Each node is then a handful of integers across the
+    arrays below, and each relation is four. The interface is the same as the
+    Graph, so it can be handed to a Composition, Combination or Difference as is.
+    """
+
+    def __init__(self):
+        self.count = entity.get_counter()
+
+        # Scratch space for subclasses, as provided by the Graph
+        self.ids = {}
+
+        # Node ids (row is the index), shared strings, and paths
+        self._ids = NodeIds(self.count.prefix)
+        self.strings = StringTable()
+        self.paths = CompactPathTrie()
+
+        # Node columns, indexed by row, and the last relation into each node
+        self._names = array.array("i")
+        self._values = array.array("i")
+        self._paths = array.array("i")
+        self._connectors = array.array("b")
+        self._last_in = array.array("i")
+
+        # Relation columns (from row, relation string, to row), and the
+        # relation before each into the same node (-1 for none)
+        self._from = array.array("i")
+        self._relation = array.array("i")
+        self._to = array.array("i")
+        self._prev_in = array.array("i")
+
+    @property
+    def nodes(self):
+        return NodeView(self)
+
+    @property
+    def relations(self):
+        return [self._relation_at(i) for i in range(len(self._from))]
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _node(self, row):
+        """
+        Generate an entity.node for a row.
+        """
+        return entity.node(
+            self._ids[row],
+            name=self.strings[self._names[row]],
+            value=self.strings[self._values[row]],
+            is_connector=bool(self._connectors[row]),
+        )
+
+    def _relation_at(self, i):
+        """
+        Generate an entity.relation for a relation index.
+        """
+        return entity.relation(
+            fromid=self._ids[self._from[i]],
+            toid=self._ids[self._to[i]],
+            relation=self.strings[self._relation[i]],
+        )
+
+    def _describe(self, row):
+        return f"{self.strings[self._names[row]]}:{self.strings[self._values[row]]}"
+
+    def _row(self, nodeid):
+        """
+        Get the row for a node id, raising a KeyError if it does not exist.
+        """
+        row = self._ids.get(nodeid)
+        if row is None:
+            raise KeyError(nodeid)
+        return row
+
+    def add_node(self, node):
+        """
+        Add an already generated node (stored as columns, not the object).
+        """
+        row = self._ids.intern(node.nodeid)
+        name = self.strings.intern(node.name)
+        value = self.strings.intern(node.value)
+        connector = 1 if node.is_connector else 0
+
+        # Adding a node id we've seen replaces it, as the dict would
+        replaced = None
+        if row < len(self._names):
+            replaced = (self.strings[self._names[row]], self.strings[self._values[row]])
+        if self.query is not None:
+            self.query.add_node(node.nodeid, node.name, node.value, replaced)
+        if replaced is not None:
+            self._names[row] = name
+            self._values[row] = value
+            self._connectors[row] = connector
+            return
+        self._names.append(name)
+        self._values.append(value)
+        self._paths.append(-1)
+        self._connectors.append(connector)
+        self._last_in.append(-1)
+
+    def _find_relation(self, fromrow, relation, torow):
+        """
+        Return if we have a relation, walking the relations into its node.
+        """
+        i = self._last_in[torow]
+        while i != -1:
+            if self._from[i] == fromrow and self._relation[i] == relation:
+                return True
+            i = self._prev_in[i]
+        return False
+
+    def _append_relation(self, fromrow, relation, torow):
+        self._prev_in.append(self._last_in[torow])
+        self._last_in[torow] = len(self._from)
+        self._from.append(fromrow)
+        self._relation.append(relation)
+        self._to.append(torow)
+
+    def add_relation(self, relation):
+        """
+        Add an already generated relation, unless we have it.
+        """
+        # The toid should not have a path yet, each node has only one parent
+        torow = self._row(relation.toid)
+        fromrow = self._row(relation.fromid)
+        name = self.strings.intern(relation.relation)
+        if self._find_relation(fromrow, name, torow):
+            return
+        parent = self._paths[fromrow]
+        if parent == -1:
+            parent = self.paths.add(self._describe(fromrow))
+
+        self._paths[torow] = self.paths.add(self._describe(torow), parent)
+        self._append_relation(fromrow, name, torow)
+        if self.query is not None:
+            self.query.add_relation(relation.fromid, relation.relation, relation.toid)
+
+    def load_nodes(self, nodes):
+        """
+        Add nodes for bulk_load as columns, returning the label of each by row.
+        """
+        intern_id = self._ids.intern
+        intern = self.strings.intern
+        segments = self.paths.segments
+        intern_label = self.paths.label
+        names = self._names
+        values = self._values
+        connectors = self._connectors
+        labels = {}
+        for node in nodes:
+            if node.__class__ is tuple and len(node) == 3:
+                nodeid, name, value = node
+                connector = False
+            else:
+                node = self.make_node(node)
+                nodeid, name, value = node.args
+                connector = node.is_connector
+            row = intern_id(nodeid)
+            if row < len(names):
+                self.add_node(entity.node(nodeid, name, value, connector))
+            else:
+                names.append(intern(name))
+                values.append(intern(value))
+                connectors.append(1 if connector else 0)
+            segment = f"{name}:{value}"
+            label = segments.get(segment)
+            labels[row] = intern_label(segment) if label is None else label
+
+        # Nodes we added have no path or relations yet
+        added = len(names) - len(self._paths)
+        self._paths.extend(array.array("i", [-1]) * added)
+        self._last_in.extend(array.array("i", [-1]) * added)
+        return labels
+
+    def load_relations(self, relations):
+        """
+        Add relations for bulk_load, returning (from row, to row) for each new one.
+        """
+        ids = self._ids
+        prefix = ids.prefix
+        start = len(prefix)
+        intern = self.strings.intern
+        last_in = self._last_in
+        prev_in = self._prev_in
+        froms = self._from
+        names = self._relation
+        tos = self._to
+        edges = []
+        for relation in relations:
+            if relation.__class__ is tuple:
+                fromid, name, toid = relation
+            else:
+                fromid, name, toid = self.make_relation(relation).args
+            if ids.table is None:
+                # Inline NodeIds.get for counter ids, which is most of the work
+                try:
+                    fromrow = int(fromid[start:])
+                    torow = int(toid[start:])
+                except (TypeError, ValueError):
+                    fromrow = torow = None
+                count = ids.count
+                if fromrow is not None and (
+                    not 0 <= fromrow < count
+                    or not 0 <= torow < count
+                    or fromid != f"{prefix}{fromrow}"
+                    or toid != f"{prefix}{torow}"
+                ):
+                    fromrow = torow = None
+                if fromrow is None:
+                    fromrow = ids.get(fromid)
+                    torow = ids.get(toid)
+            else:
+                fromrow = ids.table.get(fromid)
+                torow = ids.table.get(toid)
+            if fromrow is None or torow is None:
+                raise KeyError(toid if fromrow is not None else fromid)
+            name = intern(name)
+
+            # Walk the relations into the node to see if we have it
+            i = last_in[torow]
+            while i != -1 and (froms[i] != fromrow or names[i] != name):
+                i = prev_in[i]
+            if i != -1:
+                continue
+            prev_in.append(last_in[torow])
+            last_in[torow] = len(froms)
+            froms.append(fromrow)
+            names.append(name)
+            tos.append(torow)
+            edges.append((fromrow, torow))
+        return edges
+
+    def link_paths(self, edges, labels):
+        """
+        Compute paths for edges and labels by row (see Graph.link_paths).
+        """
+        # Make room for a path per edge up front, instead of growing as we go
+        self.paths.resize(len(edges))
+        return super().link_paths(
+            edges, labels, path_ref=self._path_ref, describe=self._describe
+        )
+
+    def _path_ref(self, row):
+        ref = self._paths[row]
+        return None if ref == -1 else ref
+
+    def set_path_refs(self, refs):
+        paths = self._paths
+        for row, ref in refs.items():
+            paths[row] = ref
+
+    def append_relation(self, relation):
+        """
+        Add a relation without a path (the nodes must exist) for bulk_load.
+        Returns False if we already have it.
+        """
+        fromrow = self._row(relation.fromid)
+        torow = self._row(relation.toid)
+        name = self.strings.intern(relation.relation)
+        if self._find_relation(fromrow, name, torow):
+            return False
+        self._append_relation(fromrow, name, torow)
+        if self.query is not None:
+            self.query.add_relation(relation.fromid, relation.relation, relation.toid)
+        return True
+
+    def has_relation(self, fromid, relation, toid):
+        """
+        Determine if the graph has a relation.
+        """
+        fromrow = self._ids.get(fromid)
+        torow = self._ids.get(toid)
+        name = self.strings.get(relation)
+        if fromrow is None or torow is None or name is None:
+            return False
+        return self._find_relation(fromrow, name, torow)
+
+    def describe(self, nodeid):
+        return self._describe(self._row(nodeid))
+
+    def path_ref(self, nodeid):
+        ref = self._paths[self._row(nodeid)]
+        return None if ref == -1 else ref
+
+    def set_path_ref(self, nodeid, ref):
+        self._paths[self._row(nodeid)] = ref
+
+    def path(self, nodeid):
+        """
+        Return the full path string for a node (empty if it has no parent).
+        """
+        row = self._ids.get(nodeid)
+        if row is None:
+            return ""
+        return self.paths.path(self._paths[row])
+
+    def to_dict(self):
+        """
+        Output dictionary representation of nodes and relations.
+        """
+        return {
+            "nodes": [self._node(row).to_dict() for row in range(len(self._ids))],
+            "relations": [
+                self._relation_at(i).to_dict() for i in range(len(self._from))
+            ],
+        }
+
+    def iter_connectors(self):
+        """
+        Yield connector nodes only
+        """
+        for row, connector in enumerate(self._connectors):
+            if connector:
+                yield self._ids[row]
+
+    def iter_nodes(self):
+        """
+        Yield nodes, with the path as the last argument.
+        """
+        ids = self._ids
+        strings = self.strings.values
+        for row, nodeid in enumerate(ids):
+            yield (
+                nodeid,
+                strings[self._names[row]],
+                strings[self._values[row]],
+                self.paths.path(self._paths[row]),
+            )
+
+    def iter_node_refs(self):
+        """
+        Yield nodes with the path reference (-1 for none) as the last argument.
+        """
+        ids = self._ids
+        strings = self.strings.values
+        for row, nodeid in enumerate(ids):
+            yield (
+                nodeid,
+                strings[self._names[row]],
+                strings[self._values[row]],
+                self._paths[row],
+            )
+
+    def iter_relations(self):
+        """
+        Yield relations in the same manner.
+        """
+        ids = self._ids
+        strings = self.strings.values
+        for fromrow, relation, torow in zip(self._from, self._relation, self._to):
+            yield ids[fromrow], strings[relation], ids[torow]
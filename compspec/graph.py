@@ -2,45 +2,286 @@ __author__ = "Vanessa Sochat"
 __copyright__ = "Copyright 2022-2024, Vanessa Sochat"
 __license__ = "MIT"
 
+import array
+import concurrent.futures
+import gc
+import hashlib
+import os
+
 import compspec.entity as entity
 
 
+def symbol_key(value):
+    """
+    Return a key for a value that is equal when the ASP symbols are.
+
+    Integers become numbers, and everything else (booleans included) a string.
+    """
+    if isinstance(value, int) and not isinstance(value, bool):
+        return f"n{value}"
+    return f"s{value}"
+
+
+# The group a worker process builds graphs for (see GraphGroup.build_parallel)
+worker_group = None
+
+
+def set_worker_group(group):
+    global worker_group
+    worker_group = group
+
+
+def build_packed(name):
+    """
+    Build the graph for a group in a worker, and pack it to send back.
+    """
+    from compspec.binary import pack_graph
+
+    return name, pack_graph(worker_group.builders[name]())
+
+
 class GraphGroup:
     """
     A graph group is intended to hold and yield named graphs.
+
+    extract can add graphs directly, or register a builder for a group with
+    add_builder, in which case the graph is only built (and then kept) the
+    first time it is asked for. Groups are yielded in the order they were added.
     """
 
     def __init__(self):
         self.graphs = {}
+        self.builders = {}
         self.extract()
 
     def __contains__(self, name):
         return name in self.graphs
 
     def __iter__(self):
-        for group, graph in self.graphs.items():
-            yield group, graph
+        for group in list(self.graphs):
+            yield group, self[group]
 
     def __getitem__(self, name):
+        if self.graphs.get(name) is None and name in self.builders:
+            self.graphs[name] = self.builders.pop(name)()
         return self.graphs.get(name)
 
+    def add_builder(self, name, builder):
+        """
+        Register a function that returns the graph for a group, when needed.
+        """
+        self.graphs[name] = None
+        self.builders[name] = builder
+
+    def build_parallel(self, names=None, workers=None):
+        """
+        Build the graphs for groups (by default, all that are not built) in
+        worker processes, returning the names built.
+
+        Each worker gets a copy of the group once, and builds groups by name.
+        Graphs are sent back packed (see compspec.binary) and unpacked into
+        a Graph here, with the same nodes, relations and paths. Builders need
+        to be usable in a worker, which is always the case with fork (the
+        default on Linux).
+        """
+        from compspec.binary import unpack_graph
+
+        if names is None:
+            names = list(self.builders)
+        names = [name for name in names if name in self.builders]
+        workers = min(workers or os.cpu_count() or 1, len(names))
+        if workers <= 1:
+            for name in names:
+                self[name]
+            return names
+
+        # Small groups (e.g., one per function) are sent a few at a time
+        chunksize = max(1, len(names) // (workers * 4))
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, initializer=set_worker_group, initargs=(self,)
+        ) as executor:
+            for name, packed in executor.map(build_packed, names, chunksize=chunksize):
+                self.graphs[name] = unpack_graph(packed)
+                del self.builders[name]
+        return names
+
+    def is_built(self, name):
+        """
+        Determine if the graph for a group has been built.
+        """
+        return name in self.graphs and name not in self.builders
+
     def extract(self):
         raise NotImplementedError
 
 
+class PathTrie:
+    """
+    A path trie stores node paths as a parent-pointer trie of interned segments.
+
+    A segment is the "name:value" description of a node, and a path is a chain
+    of segments from a root. Each path is referenced by an integer (the trie
+    node), so shared ancestry is stored once instead of repeated in a full
+    string for every node. Full path strings are only built on demand.
+    """
+
+    separator = "->"
+
+    def __init__(self):
+        # Interned segment strings
+        self.segments = {}
+        self.labels = []
+
+        # Trie nodes: the parent trie node (-1 for a root) and segment
+        self.parents = array.array("i")
+        self.tails = array.array("i")
+
+        # Lookup of (parent, segment) to trie node, so paths are shared
+        self.children = {}
+
+    def __len__(self):
+        return len(self.parents)
+
+    @classmethod
+    def from_arrays(cls, labels, parents, tails):
+        """
+        Return a trie from its segment labels, and parent and tail arrays.
+        """
+        trie = cls()
+        trie.labels = list(labels)
+        trie.segments = {segment: label for label, segment in enumerate(trie.labels)}
+        trie.parents = array.array("i", parents)
+        trie.tails = array.array("i", tails)
+        trie.children = {
+            ((parent + 1) << 32) | label: ref
+            for ref, (parent, label) in enumerate(zip(trie.parents, trie.tails))
+        }
+        return trie
+
+    def add(self, segment, parent=-1):
+        """
+        Add a segment under a parent path, returning the new path reference.
+        """
+        return self.child(parent, self.label(segment))
+
+    def label(self, segment):
+        """
+        Return the label for a segment, interning it if we have not seen it.
+        """
+        label = self.segments.get(segment)
+        if label is None:
+            label = len(self.labels)
+            self.segments[segment] = label
+            self.labels.append(segment)
+        return label
+
+    def child(self, parent, label):
+        """
+        Return the path reference for a label under a parent, adding it if needed.
+        """
+        key = ((parent + 1) << 32) | label
+        ref = self.children.get(key)
+        if ref is None:
+            ref = len(self.parents)
+            self.children[key] = ref
+            self.parents.append(parent)
+            self.tails.append(label)
+        return ref
+
+    def segments_of(self, ref):
+        """
+        Return the list of segments for a path reference, root first.
+        """
+        segments = []
+        while ref != -1:
+            segments.append(self.labels[self.tails[ref]])
+            ref = self.parents[ref]
+        segments.reverse()
+        return segments
+
+    def path(self, ref):
+        """
+        Build the full path string for a path reference.
+        """
+        if ref is None or ref == -1:
+            return ""
+        return self.separator.join(self.segments_of(ref))
+
+
+def value_key(value):
+    """
+    Return a key to look up nodes by value, so 1, True and "1" stay distinct.
+    """
+    if isinstance(value, str):
+        return value
+    try:
+        hash(value)
+    except TypeError:
+        return (value.__class__, repr(value))
+    return (value.__class__, value)
+
+
+class QueryIndex:
+    """
+    Lookups for querying a graph: the children and parents of each node (as
+    lists of (relation, node id)), and node ids by name and by (name, value).
+    """
+
+    def __init__(self, g):
+        self.children = {}
+        self.parents = {}
+        self.names = {}
+        self.values = {}
+        for node in g.iter_nodes():
+            self.add_node(*node[:3])
+
+        # A graph does not repeat relations, but a view might
+        seen = set()
+        for relation in g.iter_relations():
+            if relation not in seen:
+                seen.add(relation)
+                self.add_relation(*relation)
+
+    def add_node(self, nodeid, name, value, replaced=None):
+        """
+        Add a node, removing the (name, value) of a node it replaced.
+        """
+        if replaced is not None:
+            self.names[replaced[0]].pop(nodeid, None)
+            self.values[(replaced[0], value_key(replaced[1]))].pop(nodeid, None)
+        self.names.setdefault(name, {})[nodeid] = None
+        self.values.setdefault((name, value_key(value)), {})[nodeid] = None
+
+    def add_relation(self, fromid, relation, toid):
+        """
+        Add a relation, which the graph has checked is new.
+        """
+        self.children.setdefault(fromid, []).append((relation, toid))
+        self.parents.setdefault(toid, []).append((relation, fromid))
+
+
 class Graph:
     """
     A graph implicitly is scoped to one namespace
     """
 
+    # Indexes for queries are built on the first query, and then maintained
+    query = None
+
     def __init__(self):
         # A counter to keep track of ids in this space
         self.count = entity.get_counter()
         self.ids = {}
         self.nodes = {}
-        self.lookup = {}
         self.relations = []
 
+        # (fromid, relation, toid) we have, so adding a relation is idempotent
+        self.relation_index = set()
+
+        # Paths are references into a trie, looked up by node id
+        self.paths = PathTrie()
+        self.path_ids = {}
+
     def to_dict(self):
         """
         Output dictionary representation of nodes and relations.
@@ -51,15 +292,12 @@ class Graph:
         }
 
     @classmethod
-    def from_dict(self, obj):
+    def from_dict(cls, obj):
         """
         Return a new graph loaded from a dictionary.
         """
-        nodes = obj.get("nodes", [])
-        relations = obj.get("relations", [])
-        g = Graph()
-        [g.new_node(**x) for x in nodes]
-        [g.new_relation(**x) for x in relations]
+        g = cls()
+        g.bulk_load(obj.get("nodes", []), obj.get("relations", []))
         return g
 
     def next(self):
@@ -72,23 +310,45 @@ class Graph:
         """
         Add an already generated node.
         """
-        self.nodes[f"{node.nodeid}"] = node
+        key = f"{node.nodeid}"
+        if self.query is not None:
+            replaced = self.nodes.get(key)
+            if replaced is not None:
+                replaced = (replaced.name, replaced.value)
+            self.query.add_node(key, node.name, node.value, replaced)
+        self.nodes[key] = node
+
+    def path(self, nodeid):
+        """
+        Return the full path string for a node (empty if it has no parent).
+        """
+        return self.paths.path(self.path_ids.get(nodeid))
 
     def add_relation(self, relation):
         """
-        Add an already generated relation.
+        Add an already generated relation, unless we have it.
         """
+        if relation.args in self.relation_index:
+            return
+
         # We keep a full "identifier" for each, to provide meaning later
-        # The toid should not be in the lookup, each node has only one parent
+        # The toid should not have a path, each node has only one parent
         toid = self.nodes[relation.toid].describe()
-        if relation.fromid in self.lookup:
-            fromid = self.lookup[relation.fromid]
-        else:
-            fromid = self.nodes[relation.fromid].describe()
+        parent = self.path_ids.get(relation.fromid)
+        if parent is None:
+            parent = self.paths.add(self.nodes[relation.fromid].describe())
 
-        toid = f"{fromid}->{toid}"
-        self.lookup[relation.toid] = toid
+        self.path_ids[relation.toid] = self.paths.add(toid, parent)
         self.relations.append(relation)
+        self.relation_index.add(relation.args)
+        if self.query is not None:
+            self.query.add_relation(*relation.args)
+
+    def has_relation(self, fromid, relation, toid):
+        """
+        Determine if the graph has a relation.
+        """
+        return (fromid, relation, toid) in self.relation_index
 
     def new_node(self, name, value, nodeid=None, is_connector=False):
         """
@@ -125,9 +385,366 @@ class Graph:
         )
         self.add_node(node)
         relation = self.new_relation(fromid=parent, toid=node.nodeid, relation=relation)
-        self.add_relation(relation)
         return node, relation
 
+    def bulk_load(self, nodes=None, relations=None):
+        """
+        Add many nodes and relations in any order, and then compute paths.
+
+        Nodes can be entity.node, dicts (as from to_dict) or tuples of
+        (nodeid, name, value, is_connector), and relations can be
+        entity.relation, dicts, or (fromid, relation, toid) tuples (as from
+        iter_relations). The node and relation tables are filled in one pass
+        each, without the checks add_node and add_relation do per row, and
+        paths are computed in one pass over the relations as add_relation
+        would, except that a relation from a node that is still waiting for
+        its own path waits for it. Relations given top down give the same
+        graph as add_relation, and cycles are broken where we find them. A
+        relation to or from a node that does not exist raises a KeyError.
+        """
+        # Nothing we make here is in a cycle, so don't look for them as we go
+        collect = gc.isenabled()
+        gc.disable()
+        try:
+            labels = self.load_nodes(nodes or [])
+            edges = self.load_relations(relations or [])
+            self.set_path_refs(self.link_paths(edges, labels))
+        finally:
+            if collect:
+                gc.enable()
+
+        # Queries are indexed again when they are next asked for
+        self.query = None
+
+    def make_node(self, node):
+        """
+        Return an entity.node for a node as bulk_load takes it.
+        """
+        if isinstance(node, entity.node):
+            return node
+        if isinstance(node, dict):
+            return entity.node(
+                node.get("nodeid") or self.next(),
+                name=node["name"],
+                value=node["value"],
+                is_connector=node.get("is_connector", False),
+            )
+        return entity.node(*node)
+
+    def make_relation(self, relation):
+        """
+        Return an entity.relation for a relation as bulk_load takes it.
+        """
+        if isinstance(relation, entity.relation):
+            return relation
+        if isinstance(relation, dict):
+            return entity.relation(**relation)
+        fromid, name, toid = relation
+        return entity.relation(fromid=fromid, toid=toid, relation=name)
+
+    def load_nodes(self, nodes):
+        """
+        Add nodes for bulk_load, returning the path segment label of each.
+        """
+        graph_nodes = self.nodes
+        segments = self.paths.segments
+        intern = self.paths.label
+        make_node = self.make_node
+        labels = {}
+        for node in nodes:
+            node = make_node(node)
+            nodeid = node.nodeid
+            graph_nodes[nodeid if nodeid.__class__ is str else f"{nodeid}"] = node
+            segment = f"{node.name}:{node.value}"
+            label = segments.get(segment)
+            labels[nodeid] = intern(segment) if label is None else label
+        return labels
+
+    def load_relations(self, relations):
+        """
+        Add relations for bulk_load, returning (fromid, toid) for each new one.
+        """
+        index = self.relation_index
+        graph_relations = self.relations
+        make_relation = self.make_relation
+        edges = []
+        for relation in relations:
+            if relation.__class__ is tuple:
+                args = relation
+                if args in index:
+                    continue
+                fromid, name, toid = args
+                relation = entity.relation(fromid, toid, name)
+            else:
+                relation = make_relation(relation)
+                args = relation.args
+                if args in index:
+                    continue
+            index.add(args)
+            graph_relations.append(relation)
+            edges.append((relation.fromid, relation.toid))
+        return edges
+
+    def link_paths(self, edges, labels, path_ref=None, describe=None):
+        """
+        Compute the path reference for the child of each (fromid, toid) edge.
+
+        Labels are the path segment labels for nodes we just added, and any
+        other node is described. Returns a lookup of node id to reference.
+        A backend can give edges by another key (e.g., a row) with a path_ref
+        and describe that take it.
+        """
+        trie = self.paths
+        child = trie.child
+        path_ref = path_ref or self.path_ref
+        describe = describe or self.describe
+        refs = {}
+
+        def label(nodeid):
+            found = labels.get(nodeid)
+            if found is None:
+                found = trie.label(describe(nodeid))
+            return found
+
+        def link(toid, ref):
+            """
+            The node has a path, so relations waiting for it can go.
+            """
+            stack = [(toid, ref)]
+            while stack:
+                nodeid, parent = stack.pop()
+                for toid in waiting.pop(nodeid, ()):
+                    found = get_label(toid)
+                    ref = child(parent, label(toid) if found is None else found)
+                    refs[toid] = ref
+                    if toid in waiting:
+                        stack.append((toid, ref))
+
+        # Relations from a node with a parent (but no path yet) wait for it
+        children = {toid for _, toid in edges}
+        waiting = {}
+        get_ref = refs.get
+        get_label = labels.get
+        for fromid, toid in edges:
+            parent = get_ref(fromid)
+            if parent is None:
+                parent = path_ref(fromid)
+                if parent is None:
+                    if fromid in children:
+                        found = waiting.get(fromid)
+                        if found is None:
+                            waiting[fromid] = [toid]
+                        else:
+                            found.append(toid)
+                        continue
+                    parent = child(-1, label(fromid))
+
+            # Most nodes were just added, so we have the label
+            found = get_label(toid)
+            ref = refs[toid] = child(parent, label(toid) if found is None else found)
+            if waiting and toid in waiting:
+                link(toid, ref)
+
+        # Anything left is in a cycle
+        while waiting:
+            fromid = next(iter(waiting))
+            for toid in waiting.pop(fromid):
+                parent = get_ref(fromid)
+                if parent is None:
+                    parent = path_ref(fromid)
+                if parent is None:
+                    parent = child(-1, label(fromid))
+                ref = refs[toid] = child(parent, label(toid))
+                link(toid, ref)
+        return refs
+
+    def append_relation(self, relation):
+        """
+        Add a relation without a path (the nodes must exist) for bulk_load.
+        Returns False if we already have it.
+        """
+        # Like add_relation, this raises a KeyError if a node does not exist
+        for nodeid in relation.fromid, relation.toid:
+            self.nodes[nodeid]
+        if relation.args in self.relation_index:
+            return False
+        self.relations.append(relation)
+        self.relation_index.add(relation.args)
+        if self.query is not None:
+            self.query.add_relation(*relation.args)
+        return True
+
+    def describe(self, nodeid):
+        """
+        Return the path segment (name:value) for a node.
+        """
+        return self.nodes[nodeid].describe()
+
+    def path_ref(self, nodeid):
+        """
+        Return the path reference for a node, or None if it has no path.
+        """
+        return self.path_ids.get(nodeid)
+
+    def set_path_ref(self, nodeid, ref):
+        """
+        Set the path reference for a node.
+        """
+        self.path_ids[nodeid] = ref
+
+    def set_path_refs(self, refs):
+        """
+        Set the path references from a lookup of node id to reference.
+        """
+        self.path_ids.update(refs)
+
+    def iter_node_refs(self):
+        """
+        Yield nodes with the path reference (-1 for none) as the last argument.
+        """
+        for node in self.nodes.values():
+            ref = self.path_ids.get(node.nodeid)
+            yield node.args + (-1 if ref is None else ref,)
+
+    def query_index(self):
+        """
+        Return the indexes for queries, building them if we need to.
+        """
+        if self.query is None:
+            self.query = QueryIndex(self)
+        return self.query
+
+    def children(self, nodeid, relation=None):
+        """
+        Return the ids of the children of a node, optionally by relation.
+        """
+        children = self.query_index().children.get(nodeid, {})
+        return [toid for name, toid in children if relation in (None, name)]
+
+    def parents(self, nodeid, relation=None):
+        """
+        Return the ids of the parents of a node, optionally by relation.
+        """
+        parents = self.query_index().parents.get(nodeid, {})
+        return [fromid for name, fromid in parents if relation in (None, name)]
+
+    def find(self, name=None, value=None):
+        """
+        Return the ids of nodes with a name, a value, or both.
+
+        Without either, we return every node id.
+        """
+        index = self.query_index()
+        if name is not None and value is not None:
+            return list(index.values.get((name, value_key(value)), []))
+        if name is not None:
+            return list(index.names.get(name, []))
+        if value is None:
+            return [node[0] for node in self.iter_nodes()]
+        key = value_key(value)
+        found = []
+        for name in index.names:
+            found += index.values.get((name, key), [])
+        return found
+
+    def subtree(self, nodeid):
+        """
+        Return the ids of a node and every node below it, parents first.
+        """
+        children = self.query_index().children
+        found = [nodeid]
+        seen = {nodeid}
+        for current in found:
+            for _, child in children.get(current, []):
+                if child not in seen:
+                    seen.add(child)
+                    found.append(child)
+        return found
+
+    def _adjacency(self):
+        """
+        Return a lookup of node id to the (relation, child id) for each child.
+        """
+        if self.query is not None:
+            return self.query.children
+        children = {}
+        for fromid, relation, toid in self.iter_relations():
+            if fromid not in children:
+                children[fromid] = set()
+            children[fromid].add((relation, toid))
+        return children
+
+    def fingerprint(self):
+        """
+        Return a digest of the facts for the graph (nodes, relations and
+        connectors, in order), e.g., to key a cache of results.
+
+        The same graph built in another order has another fingerprint.
+        """
+        h = hashlib.blake2b(digest_size=16)
+        for kind, facts in [
+            (b"n", self.iter_nodes()),
+            (b"r", self.iter_relations()),
+            (b"c", self.iter_connectors()),
+        ]:
+            h.update(kind)
+            for fact in facts:
+                h.update(repr(fact).encode("utf-8"))
+                h.update(b"\0")
+        return h.hexdigest()
+
+    def subtree_hashes(self):
+        """
+        Compute a content (Merkle) hash for the subtree under every node.
+
+        The hash combines the node name, value and connector flag with the
+        relation and hash of each child, so two subtrees with the same content
+        have the same hash regardless of node ids. Returns a lookup of node id
+        to digest.
+        """
+        children = self._adjacency()
+        connectors = set(self.iter_connectors())
+        content = {node[0]: node[1:3] for node in self.iter_nodes()}
+
+        def update(h, field):
+            field = field.encode("utf-8")
+            h.update(len(field).to_bytes(4, "little"))
+            h.update(field)
+
+        # Iterative post-order traversal, so deep graphs don't recurse
+        hashes = {}
+        visiting = set()
+        for start in content:
+            stack = [(start, False)]
+            while stack:
+                nodeid, expanded = stack.pop()
+                if not expanded:
+                    if nodeid in hashes or nodeid in visiting:
+                        continue
+                    visiting.add(nodeid)
+                    stack.append((nodeid, True))
+                    for _, child in children.get(nodeid, []):
+                        if child in content and child not in hashes:
+                            stack.append((child, False))
+                    continue
+
+                # A child still being visited is a cycle, and contributes nothing
+                name, value = content[nodeid]
+                h = hashlib.blake2b(digest_size=16)
+                update(h, symbol_key(name))
+                update(h, symbol_key(value))
+                update(h, "c" if nodeid in connectors else "")
+                for relation, digest in sorted(
+                    (str(relation), hashes.get(child, b""))
+                    for relation, child in children.get(nodeid, [])
+                    if child in content
+                ):
+                    update(h, relation)
+                    h.update(digest)
+                visiting.discard(nodeid)
+                hashes[nodeid] = h.digest()
+        return hashes
+
     def iter_connectors(self):
         """
         Yield connector nodes only
@@ -142,7 +759,7 @@ class Graph:
         added (e.g., node, namespace, *args)
         """
         for _, node in self.nodes.items():
-            yield node.args + (self.lookup.get(node.nodeid, ""),)
+            yield node.args + (self.path(node.nodeid),)
 
     def iter_relations(self):
         """
@@ -150,3 +767,90 @@ class Graph:
         """
         for relation in self.relations:
             yield relation.args
+
+
+class ReadOnlyGraphError(TypeError):
+    """
+    Raised when adding to a graph that is read-only.
+    """
+
+
+class ReadOnlyGraph(Graph):
+    """
+    A graph that only provides facts (iter_nodes, iter_relations and
+    iter_connectors), e.g., from a file or a window of another graph.
+
+    It does not call Graph.__init__, so it keeps no tables of its own.
+    Nodes and relations are generated from the facts when first asked for,
+    and adding to the graph raises a ReadOnlyGraphError.
+    """
+
+    _node_lookup = None
+    _relation_index = None
+
+    @property
+    def nodes(self):
+        if self._node_lookup is None:
+            connectors = set(self.iter_connectors())
+            self._node_lookup = {
+                nodeid: entity.node(
+                    nodeid, name=name, value=value, is_connector=nodeid in connectors
+                )
+                for nodeid, name, value, _ in self.iter_nodes()
+            }
+        return self._node_lookup
+
+    @property
+    def relations(self):
+        return [
+            entity.relation(fromid=fromid, toid=toid, relation=relation)
+            for fromid, relation, toid in self.iter_relations()
+        ]
+
+    def has_relation(self, fromid, relation, toid):
+        """
+        Determine if the graph has a relation.
+        """
+        if self._relation_index is None:
+            self._relation_index = set(self.iter_relations())
+        return (fromid, relation, toid) in self._relation_index
+
+    def read_only(self, *args, **kwargs):
+        raise ReadOnlyGraphError(f"A {self.__class__.__name__} is read-only.")
+
+    next = add_node = add_relation = append_relation = read_only
+    new_node = new_relation = gen = bulk_load = read_only
+    set_path_ref = set_path_refs = read_only
+
+
+class GraphView(ReadOnlyGraph):
+    """
+    A read-only view of some nodes and relations from a graph.
+
+    Nodes keep the path from the graph they came from. The view provides
+    the iterators used to generate facts (and to hash subtrees) so it can
+    be handed to a Composition, Combination or Difference like a graph.
+    """
+
+    def __init__(self, nodes, relations, connectors=None):
+        self._nodes = nodes
+        self._relations = relations
+        self._connectors = connectors or []
+        self._paths = None
+
+    def path(self, nodeid):
+        """
+        Return the full path string for a node (empty if it has no parent).
+        """
+        if self._paths is None:
+            self._paths = {node[0]: node[-1] for node in self._nodes}
+        return self._paths.get(nodeid, "")
+
+    def iter_connectors(self):
+        yield from self._connectors
+
+    def iter_nodes(self):
+        yield from self._nodes
+
+    def iter_relations(self):
+        yield from self._relations
@@ -2,11 +2,17 @@ __author__ = "Vanessa Sochat"
 __copyright__ = "Copyright 2022-2024, Vanessa Sochat"
 __license__ = "MIT"
 
+import functools
+import gzip
 import os
+import time
 
 import clingo
+import clingo.ast
 
-import compspec.logger as logger
+import compspec.utils as utils
+from compspec.graph import symbol_key
+from compspec.logger import logger
 
 clingo_cffi = hasattr(clingo.Symbol, "_rep")
 
@@ -23,10 +29,10 @@ def _id(thing):
     return '"%s"' % str(thing)
 
 
-def argify(arg):
-    """
-    Convert an argument into a clingo one.
-    """
+@functools.lru_cache(maxsize=65536, typed=True)
+def _argify(arg):
+    if isinstance(arg, clingo.Symbol):
+        return arg
     if isinstance(arg, bool):
         return clingo.String(str(arg))
     elif isinstance(arg, int):
@@ -34,6 +40,20 @@ def argify(arg):
     return clingo.String(str(arg))
 
 
+def argify(arg):
+    """
+    Convert an argument into a clingo one.
+
+    Symbols for repeated arguments (namespaces, names, relations) are cached,
+    keyed by type so 1, True and "1" stay distinct. Unhashable arguments are
+    converted without the cache.
+    """
+    try:
+        return _argify(arg)
+    except TypeError:
+        return _argify.__wrapped__(arg)
+
+
 class AspFunction:
     """
     An asp function
@@ -70,6 +90,72 @@ class AspFunctionBuilder(object):
 fn = AspFunctionBuilder()
 
 
+def stringify(x):
+    """
+    Return a string for a symbol (the string itself for a clingo String)
+    """
+    if clingo_cffi:
+        # Clingo w/ CFFI will throw an exception on failure
+        try:
+            return x.string
+        except RuntimeError:
+            return str(x)
+    else:
+        return x.string or str(x)
+
+
+def plain(symbol):
+    """
+    Return the value for a symbol (a number, the string for a clingo String,
+    or the symbol as text), as it would be given to argify.
+    """
+    if symbol.type == clingo.SymbolType.Number:
+        return symbol.number
+    if symbol.type == clingo.SymbolType.String:
+        return symbol.string
+    return str(symbol)
+
+
+def show_signatures(logic_programs):
+    """
+    Get the (name, arity, positive) signatures shown by logic programs.
+
+    Returns the signatures and if every atom is shown (no show statements),
+    or None if the programs show terms, which aren't atoms we can read.
+    Programs are parsed again if a file changes (by modified time or size).
+    """
+    stats = []
+    for filename in logic_programs:
+        stat = os.stat(filename)
+        stats.append((filename, stat.st_mtime_ns, stat.st_size))
+    return parse_show_signatures(tuple(stats))
+
+
+@functools.lru_cache(maxsize=128)
+def parse_show_signatures(logic_programs):
+    """
+    Parse the show statements from (filename, mtime, size) of logic programs.
+    """
+    signatures = set()
+    statements = []
+
+    def add(statement):
+        if statement.ast_type == clingo.ast.ASTType.ShowTerm:
+            statements.append(statement)
+        elif statement.ast_type == clingo.ast.ASTType.ShowSignature:
+            statements.append(statement)
+            if statement.name:
+                signatures.add(
+                    (statement.name, statement.arity, bool(statement.positive))
+                )
+
+    if logic_programs:
+        clingo.ast.parse_files([filename for filename, _, _ in logic_programs], add)
+    if any(x.ast_type == clingo.ast.ASTType.ShowTerm for x in statements):
+        return
+    return signatures, not statements
+
+
 class Result:
     """
     Result of an ASP solve.
@@ -82,41 +168,235 @@ class Result:
         self.warnings = None
         self.nmodels = 0
 
+        # The search was stopped (a timeout or interrupt) before it finished
+        self.interrupted = False
+
+        # The answers came from a ResultCache, and nothing was solved
+        self.cached = False
+
         # specs ordered by optimization level
         self.answers = []
         self.cores = []
 
+        # Seconds for each phase (setup, load, ground, solve) and solver counts
+        self.timings = {}
+        self.statistics = {}
+
+    def to_dict(self):
+        """
+        Return timings and statistics for the solve (e.g., to save as json)
+        """
+        return {
+            "satisfiable": self.satisfiable,
+            "interrupted": self.interrupted,
+            "cached": self.cached,
+            "nmodels": self.nmodels,
+            "timings": self.timings,
+            "statistics": self.statistics,
+        }
+
+
+def get_statistics(stats):
+    """
+    Get counts of atoms, rules, conflicts and choices from clingo statistics.
+    """
+    problem = stats.get("problem", {}).get("lp", {})
+    solvers = stats.get("solving", {}).get("solvers", {})
+    return {
+        "atoms": int(problem.get("atoms", 0)),
+        "rules": int(problem.get("rules", 0)),
+        "conflicts": int(solvers.get("conflicts", 0)),
+        "choices": int(solvers.get("choices", 0)),
+    }
+
+
+# Named solver profiles, as clingo configuration settings. The default is
+# the configuration compspec has always used.
+profiles = {
+    "default": {
+        "configuration": "tweety",
+        "solver.opt_strategy": "usc,one",
+        "asp.eq": "5",
+        "asp.trans_ext": "all",
+    },
+    # Clingo's own defaults
+    "clingo": {"configuration": "auto"},
+    # Less preprocessing, for programs that grounding (almost) decides
+    "light": {"configuration": "tweety", "asp.eq": "1", "asp.trans_ext": "dynamic"},
+    # Clasp configurations for harder (e.g., custom) programs
+    "crafty": {"configuration": "crafty", "solver.opt_strategy": "usc,one"},
+    "trendy": {"configuration": "trendy", "solver.opt_strategy": "usc,one"},
+    "jumpy": {"configuration": "jumpy", "solver.opt_strategy": "usc,one"},
+    "frumpy": {"configuration": "frumpy", "solver.opt_strategy": "usc,one"},
+}
+
+# The default number of solver threads, and ground atoms per thread for "auto"
+default_threads = 2
+atoms_per_thread = 50000
+
+
+def get_cpus():
+    """
+    Get the number of cpus we are allowed to run on.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def auto_threads(atoms):
+    """
+    Choose a thread count for a ground program: one per atoms_per_thread
+    atoms, and no more than the cpus we have.
+    """
+    return max(1, min(get_cpus(), atoms // atoms_per_thread))
+
+
+def configure(control, profile="default", threads=None):
+    """
+    Apply a named solver profile (and a thread count) to a control object.
+    """
+    if profile not in profiles:
+        raise ValueError(
+            f"Solver profile {profile} is not known, choices are {list(profiles)}"
+        )
+    for key, value in profiles[profile].items():
+        config = control.configuration
+        *parents, name = key.split(".")
+        for parent in parents:
+            config = getattr(config, parent)
+        setattr(config, name, value)
+    if threads != "auto":
+        control.configuration.solve.parallel_mode = str(threads or default_threads)
+
+
+def bench_profiles(logic_programs, names=None, threads=None, repeat=1, nmodels=1):
+    """
+    Ground and solve logic programs (e.g., facts written by a Difference and
+    is-compatible.lp) under each solver profile.
+
+    Returns a row per profile with the best time over repeats for the ground
+    and solve, fastest first. Gzipped programs (ending in .gz) are supported.
+    """
+    rows = []
+    for name in names or list(profiles):
+        best = None
+        for _ in range(repeat):
+            control = clingo.Control()
+            configure(control, name, threads)
+            control.configuration.solve.models = nmodels
+
+            start = time.perf_counter()
+            for logic_program in logic_programs:
+                if str(logic_program).endswith(".gz"):
+                    with gzip.open(logic_program, "rt") as fd:
+                        control.add("base", [], fd.read())
+                else:
+                    control.load(logic_program)
+            control.ground([("base", [])])
+            if threads == "auto":
+                control.configuration.solve.parallel_mode = str(
+                    auto_threads(len(control.symbolic_atoms))
+                )
+            grounded = time.perf_counter()
+            satisfiable = control.solve().satisfiable
+            done = time.perf_counter()
+
+            row = {
+                "profile": name,
+                "threads": control.configuration.solve.parallel_mode.split(",")[0],
+                "satisfiable": satisfiable,
+                "ground": grounded - start,
+                "solve": done - grounded,
+                "total": done - start,
+            }
+            if best is None or row["total"] < best["total"]:
+                best = row
+        rows.append(best)
+    return sorted(rows, key=lambda row: row["total"])
+
 
 class PyclingoDriver:
-    def __init__(self, cores=True, out=None, quiet=False):
+    def __init__(
+        self,
+        cores=True,
+        out=None,
+        quiet=False,
+        compress=None,
+        lazy_cores=True,
+        ground_only=False,
+        profile="default",
+        threads=None,
+    ):
         """
         Driver for the Python clingo interface.
         Arguments:
             cores (bool): whether to generate unsatisfiable cores for better
                 error reporting.
-            out (file-like): optional stream to write a text-based ASP program
-                for debugging or verification.
+            out (file-like or str): optional stream or filename to write a
+                text-based ASP program for debugging or verification.
+            compress (bool): gzip the output file (default: if it ends in .gz)
+            lazy_cores (bool): add plain facts, and only solve again with
+                assumptions (to get cores) if the problem is unsatisfiable.
+            ground_only (bool): skip the solve if grounding derived every atom
+                as a fact (e.g., for a stratified program).
+            profile (str): the name of a solver profile (see profiles).
+            threads (int or str): solver threads (default 2), or "auto" to
+                choose by the size of the ground program.
         """
+        self.profile = "default"
+        self.threads = None
+        self.ground_only = False
+        self.set_options(profile, threads, ground_only)
+        self.out = None
+        self.sink = None
+        self.compress = compress
         self.set_verbosity(out, quiet)
         self.cores = cores
+        self.lazy_cores = lazy_cores
+        self.choices = cores
+        self.deadline = None
+        self.interrupted = False
+
+        # The encoding of names, values and paths in facts, if they are encoded
+        self.encoding = None
+
+        # The backend facts are added to, and facts we collect without one
+        self.backend = None
+        self.collected = None
 
     def set_verbosity(self, out, quiet=False):
         """
         Set (or update) verbosity or output stream.
+
+        If out is a filename we open it (and close it when done). When quiet
+        (or without out) nothing is formatted or written.
         """
-        if out and not quiet:
-            self.out = out
-        else:
-            self.devnull()
+        self.close()
+        if not out or quiet:
+            return
+        if isinstance(out, (str, os.PathLike)):
+            out = self.sink = utils.open_output(out, compress=self.compress)
+        self.out = out
+
+    def close(self):
+        """
+        Close the output file, if we opened one.
+        """
+        if self.sink is not None:
+            self.sink.close()
+        self.sink = None
+        self.out = None
 
-    def devnull(self):
-        self.f = open(os.devnull, "w")
-        self.out = self.f
+    def __enter__(self):
+        return self
 
-    def __exit__(self):
-        self.f.close()
+    def __exit__(self, *args):
+        self.close()
 
     def title(self, name, char):
+        if self.out is None:
+            return
         self.out.write("\n")
         self.out.write("%" + (char * 76))
         self.out.write("\n")
@@ -131,22 +411,188 @@ class PyclingoDriver:
         self.title(name, "-")
 
     def comment(self, msg):
-        self.out.write("% " + msg + "\n")
+        if self.out is not None:
+            self.out.write("% " + msg + "\n")
 
     def newline(self):
-        self.out.write("\n")
+        if self.out is not None:
+            self.out.write("\n")
 
     def fact(self, head):
         """
         ASP fact (a rule without a body).
         """
         symbol = head.symbol() if hasattr(head, "symbol") else head
-        self.out.write("%s.\n" % str(symbol))
+        if self.out is not None:
+            self.out.write("%s.\n" % symbol)
+        if self.backend is None:
+            self.collect(symbol.name, [plain(arg) for arg in symbol.arguments])
+        else:
+            self.add_fact(symbol)
+
+    def facts(self, rows, prefix=()):
+        """
+        Add facts from (name, arguments) tuples, e.g., from Graph.iter_nodes.
+
+        This skips making an AspFunction for each fact. Prefix arguments (e.g.,
+        a namespace) come before the arguments for each row.
+        """
+        # Without a solver we only need symbols to write facts out
+        collect = self.backend is None and self.collected is not None
+        if self.backend is None and self.out is None:
+            if collect:
+                for name, arguments in rows:
+                    self.collect(name, list(prefix) + list(arguments))
+            return
+        symbols = [argify(arg) for arg in prefix]
+        for name, arguments in rows:
+            symbol = clingo.Function(name, symbols + [argify(arg) for arg in arguments])
+            if self.out is not None:
+                self.out.write("%s.\n" % symbol)
+            if collect:
+                self.collect(name, list(prefix) + list(arguments))
+            elif self.backend is not None:
+                self.add_fact(symbol)
+
+    def collect(self, name, arguments):
+        """
+        Keep a fact generated without a solver (see generate), if we want them.
+
+        Facts are kept once (as the solver would), by the symbols they would be.
+        """
+        if self.collected is None:
+            return
+        arguments = [
+            plain(arg) if isinstance(arg, clingo.Symbol) else arg for arg in arguments
+        ]
+        key = (name,) + tuple(symbol_key(arg) for arg in arguments)
+        if key not in self.collected:
+            self.collected[key] = (name, [str(arg) for arg in arguments])
+
+    def add_fact(self, symbol):
+        """
+        Add a symbol as a fact (a choice with an assumption if we want cores)
+        """
         atom = self.backend.add_atom(symbol)
-        self.backend.add_rule([atom], [], choice=self.cores)
-        if self.cores:
+        self.backend.add_rule([atom], [], choice=self.choices)
+        if self.choices:
             self.assumptions.append(atom)
 
+    def set_options(self, profile=None, threads=None, ground_only=None):
+        """
+        Set the solver profile, threads and ground_only, for those not None.
+        """
+        if profile is not None:
+            if profile not in profiles:
+                raise ValueError(
+                    f"Solver profile {profile} is not known, choices are {list(profiles)}"
+                )
+            self.profile = profile
+        if threads is not None:
+            if threads != "auto" and int(threads) < 1:
+                raise ValueError("A solve needs at least one thread.")
+            self.threads = threads
+        if ground_only is not None:
+            self.ground_only = ground_only
+
+    def configure(self, control):
+        """
+        Set the solver configuration for a control object.
+        """
+        configure(control, self.profile, self.threads)
+
+    def set_threads(self):
+        """
+        Choose the thread count for the ground program, if it is "auto".
+        """
+        if self.threads != "auto":
+            return
+        threads = auto_threads(len(self.control.symbolic_atoms))
+        logger.debug(f"Solving with {threads} threads")
+        self.control.configuration.solve.parallel_mode = str(threads)
+
+    def init_control(self, logic_programs):
+        """
+        Create the control object for a solve.
+        """
+        control = clingo.Control()
+        self.configure(control)
+        return control
+
+    def load(self, logic_programs):
+        """
+        Read in provided logic programs.
+        """
+        for logic_program in logic_programs:
+            self.control.load(logic_program)
+
+    def ground(self):
+        """
+        Ground the facts and logic programs.
+        """
+        self.control.ground([("base", [])])
+
+    def shown(self, symbol):
+        """
+        Return the symbol to report for a shown (or core) atom.
+        """
+        return symbol
+
+    def finish(self):
+        """
+        Clean up after a solve.
+        """
+        pass
+
+    def get_answers(self, symbols):
+        """
+        Organize shown symbols into answers, by name.
+
+        If the facts were encoded, encoded arguments are decoded here.
+        """
+        answers = {}
+        tostring = stringify if self.encoding is None else self.encoding.decode
+        for sym in symbols:
+            sym = self.shown(sym)
+            if sym is None:
+                continue
+            if sym.name not in answers:
+                answers[sym.name] = []
+            answers[sym.name].append([tostring(a) for a in sym.arguments])
+        return answers
+
+    def grounded_model(self, logic_programs):
+        """
+        Return the shown symbols if grounding decided the answer set.
+
+        For a stratified program (and plain facts) the grounder derives every
+        atom as a fact, so the only answer set is the facts and we don't need
+        to solve. We return None if any atom is not a fact, if grounding found
+        a conflict, or if the programs show terms.
+        """
+        shown = show_signatures(logic_programs)
+        if shown is None or self.control.is_conflicting:
+            return
+        atoms = self.control.symbolic_atoms
+        signatures, show_all = shown
+
+        # Shown atoms are the most likely to be undecided, so check them first.
+        # The order is the same as a model (as the atoms were added)
+        symbols = []
+        for signature in atoms.signatures:
+            if show_all or signature in signatures:
+                for atom in atoms.by_signature(*signature):
+                    if not atom.is_fact:
+                        return
+                    symbols.append(atom.symbol)
+
+        # Any other undecided atom could still make the program unsatisfiable
+        if not show_all:
+            for atom in atoms:
+                if not atom.is_fact:
+                    return
+        return symbols
+
     def solve(
         self,
         setup,
@@ -154,9 +600,126 @@ class PyclingoDriver:
         stats=False,
         logic_programs=None,
         facts_only=False,
+        timeout=None,
     ):
         """
         Run the solver for a model and some number of logic programs
+
+        Facts are added with a choice and an assumption each when we want
+        cores. With lazy cores we add plain facts, and only if the problem is
+        unsatisfiable do we solve again that way to get the cores.
+
+        With a timeout (seconds) we stop the search when it runs out, and
+        return the best model found so far (if any) flagged as interrupted.
+        Setup and grounding count toward the timeout, but can't be stopped.
+        With facts_only we return the facts without a solver (see generate).
+        """
+        if facts_only:
+            return self.generate(setup)
+        self.deadline = None if timeout is None else time.perf_counter() + timeout
+        self.choices = self.cores and not self.lazy_cores
+        result = self.solve_once(setup, nmodels, stats, logic_programs)
+        if (
+            result is None
+            or result.satisfiable
+            or result.interrupted
+            or self.choices
+            or not self.cores
+        ):
+            return result
+
+        # Don't write the facts a second time
+        logger.debug("The problem is unsatisfiable, solving again to find cores.")
+        out, self.out = self.out, None
+        self.choices = True
+        try:
+            cores = self.solve_once(setup, nmodels, stats, logic_programs)
+        finally:
+            self.out = out
+
+        # Timings include both solves
+        for phase, seconds in result.timings.items():
+            cores.timings[phase] += seconds
+        return cores
+
+    def interrupt(self):
+        """
+        Stop the current solve (e.g., from another thread).
+
+        The solve returns a result flagged as interrupted. If the search has
+        not started yet (e.g., we are grounding) the next search is skipped.
+        A Composition, Combination or Difference drops an interrupt left from
+        before it starts a run.
+        """
+        self.interrupted = True
+        control = getattr(self, "control", None)
+        if control is not None:
+            control.interrupt()
+
+    def search(self, **kwargs):
+        """
+        Run the search, and cancel it at the deadline if we have one.
+
+        Returns if the problem is satisfiable (None if we don't know) and
+        if the search was interrupted. This takes any pending interrupt.
+        """
+        if self.interrupted:
+            self.interrupted = False
+            return None, True
+        if self.deadline is None:
+            solve_result = self.control.solve(**kwargs)
+        else:
+            with self.control.solve(async_=True, **kwargs) as handle:
+                if not handle.wait(max(0.0, self.deadline - time.perf_counter())):
+                    logger.debug("The solve timed out, cancelling the search.")
+                    handle.cancel()
+                solve_result = handle.get()
+        interrupted = solve_result.interrupted or self.interrupted
+        self.interrupted = False
+        return solve_result.satisfiable, interrupted
+
+    def generate(self, setup, collect=True):
+        """
+        Generate the facts for a setup without a solver.
+
+        Without logic programs the only answer set is the facts, so we return
+        a result with them as answers (like a solve would, without clingo).
+        Facts are still written to the output, and if we don't collect them
+        (e.g., to only write them out) they aren't kept.
+        """
+        start = time.perf_counter()
+        self.backend = None
+        self.collected = {} if collect else None
+
+        # We don't need to encode facts without a solver
+        encoding = getattr(setup, "encoding", None)
+        if encoding is not None:
+            setup.encoding = None
+        try:
+            setup.setup(self)
+            facts = self.collected
+        finally:
+            self.collected = None
+            if encoding is not None:
+                setup.encoding = encoding
+        if self.sink is not None:
+            self.sink.flush()
+
+        result = Result()
+        result.satisfiable = True
+        result.nmodels = 1
+        if facts is not None:
+            answers = result.answers = {}
+            for name, arguments in facts.values():
+                if name not in answers:
+                    answers[name] = []
+                answers[name].append(arguments)
+        result.timings = {"setup": time.perf_counter() - start}
+        return result
+
+    def solve_once(self, setup, nmodels=0, stats=False, logic_programs=None):
+        """
+        Run one solve, adding facts as choices (with assumptions) if needed.
         """
         # logic programs to give to the solver
         logic_programs = logic_programs or []
@@ -164,39 +727,59 @@ class PyclingoDriver:
             logic_programs = [logic_programs]
 
         # Initialize the control object for the solver
-        self.control = clingo.Control()
+        self.control = self.init_control(logic_programs)
         self.control.configuration.solve.models = nmodels
-        self.control.configuration.asp.trans_ext = "all"
-        self.control.configuration.asp.eq = "5"
-        self.control.configuration.configuration = "tweety"
-        self.control.configuration.solve.parallel_mode = "2"
-        self.control.configuration.solver.opt_strategy = "usc,one"
 
         # set up the problem -- this generates facts and rules
+        timings = {}
+        start = time.perf_counter()
         self.assumptions = []
+        self.encoding = getattr(setup, "encoding", None)
         with self.control.backend() as backend:
             self.backend = backend
             setup.setup(self)
-
-        # If we only want to generate facts, cut out early
-        if facts_only:
-            return
+        self.backend = None
+        if self.sink is not None:
+            self.sink.flush()
+        timings["setup"] = time.perf_counter() - start
 
         # read in provided logic programs
-        for logic_program in logic_programs:
-            self.control.load(logic_program)
+        start = time.perf_counter()
+        self.load(logic_programs)
+        timings["load"] = time.perf_counter() - start
 
         # Grounding is the first step in the solve -- it turns our facts
         # and first-order logic rules into propositional logic.
-        self.control.ground([("base", [])])
+        start = time.perf_counter()
+        self.ground()
+        self.set_threads()
+        timings["ground"] = time.perf_counter() - start
 
         # With a grounded program, we can run the solve.
+        start = time.perf_counter()
         result = Result()
-        models = []  # stable models if things go well
+        result.timings = timings
+
+        # Unless grounding already decided the answer set
+        if self.ground_only and not self.choices:
+            symbols = self.grounded_model(logic_programs)
+            if symbols is not None:
+                result.satisfiable = True
+                result.nmodels = 1
+                result.answers = self.get_answers(symbols)
+                timings["solve"] = time.perf_counter() - start
+                self.finish()
+                return result
+
+        best = []  # the best (lowest cost) stable model if things go well
         cores = []  # unsatisfiable cores if they do not
 
+        # Only keep the best model seen so far (the first, for equal costs).
+        # Symbols can't be compared, so we only compare costs
         def on_model(model):
-            models.append((model.cost, model.symbols(shown=True, terms=True)))
+            result.nmodels += 1
+            if not best or model.cost < best[0][0]:
+                best[:] = [(model.cost, model.symbols(shown=True, terms=True))]
 
         # Won't work after this, need to write files
         solve_kwargs = {
@@ -206,39 +789,295 @@ class PyclingoDriver:
         }
         if clingo_cffi:
             solve_kwargs["on_unsat"] = cores.append
-        solve_result = self.control.solve(**solve_kwargs)
-
-        # once done, construct the solve result
-        result.satisfiable = solve_result.satisfiable
-
-        def stringify(x):
-            if clingo_cffi:
-                # Clingo w/ CFFI will throw an exception on failure
-                try:
-                    return x.string
-                except RuntimeError:
-                    return str(x)
-            else:
-                return x.string or str(x)
+        result.satisfiable, result.interrupted = self.search(**solve_kwargs)
 
+        # once done, construct the solve result (the best so far if interrupted)
         if result.satisfiable:
-            min_cost, best_model = min(models)
-            result.answers = {}
-            for sym in best_model:
-                if sym.name not in result.answers:
-                    result.answers[sym.name] = []
-                result.answers[sym.name].append([stringify(a) for a in sym.arguments])
-
-        elif cores:
+            min_cost, best_model = best[0]
+            result.answers = self.get_answers(best_model)
+
+        elif cores and not result.interrupted:
             symbols = dict((a.literal, a.symbol) for a in self.control.symbolic_atoms)
             for core in cores:
                 core_symbols = []
                 for atom in core:
-                    sym = symbols[atom]
-                    core_symbols.append(sym)
+                    sym = self.shown(symbols[atom])
+                    if sym is not None:
+                        core_symbols.append(sym)
                 result.cores.append(core_symbols)
 
+        timings["solve"] = time.perf_counter() - start
+        result.statistics = get_statistics(self.control.statistics)
         if stats:
             print("Statistics:")
             logger.info(self.control.statistics)
+        self.finish()
         return result
+
+
+# The program part and external for a step of the persistent driver
+step_part = "compspec"
+step_atom = "compspec_step"
+
+
+class StepTransformer(clingo.ast.Transformer):
+    """
+    Move a logic program into a step of a multi-shot solve.
+
+    Every atom gets the step as a first argument, and every rule is
+    guarded by the external for the step, so releasing the external
+    removes everything derived in the step. The base program becomes
+    the parameterized part, so it can be grounded again for each step.
+    """
+
+    def __init__(self):
+        statements = []
+        clingo.ast.parse_string(
+            f"#program {step_part}(k). :- {step_atom}(k).", statements.append
+        )
+        self.program = statements[1]
+        self.guard = statements[2].body[0]
+        self.step = self.guard.atom.symbol.arguments[0]
+
+    def visit_Program(self, program):
+        if program.name == "base":
+            return self.program
+        return program
+
+    def visit_SymbolicAtom(self, atom):
+        symbol = atom.symbol
+        if symbol.ast_type == clingo.ast.ASTType.UnaryOperation:
+            argument = symbol.argument
+            argument = argument.update(arguments=[self.step] + list(argument.arguments))
+            return atom.update(symbol=symbol.update(argument=argument))
+        if symbol.ast_type == clingo.ast.ASTType.Function:
+            symbol = symbol.update(arguments=[self.step] + list(symbol.arguments))
+            return atom.update(symbol=symbol)
+        return atom
+
+    def guarded(self, statement):
+        statement = statement.update(**self.visit_children(statement))
+        return statement.update(body=list(statement.body) + [self.guard])
+
+    visit_Rule = guarded
+    visit_Minimize = guarded
+    visit_External = guarded
+    visit_ShowTerm = guarded
+
+    def signature(self, statement):
+        if not statement.name:
+            return statement
+        return statement.update(arity=statement.arity + 1)
+
+    visit_ShowSignature = signature
+    visit_Defined = signature
+    visit_ProjectSignature = signature
+
+
+class PersistentPyclingoDriver(PyclingoDriver):
+    """
+    A driver that parses logic programs once, and reuses them across solves.
+
+    This uses clingo multi-shot solving: the logic programs are parsed and
+    rewritten once into a parameterized program part, and each solve adds its
+    facts (guarded by an external for the step) and grounds the part for that
+    step. After the solve the external is released, so facts from one diff
+    never reach the next. Only shown atoms that are declared by signature
+    (#show name/arity) are reported.
+
+    Clingo does not reclaim solver variables for released steps, so solves get
+    slower as steps accumulate. We start a new control (adding the already
+    parsed statements) every max_steps solves, or when the logic programs change.
+
+    This is not faster for is-compatible.lp: grounding and solving the facts
+    for each step costs more than the parsing it saves (see report).
+    """
+
+    def __init__(
+        self,
+        cores=True,
+        out=None,
+        quiet=False,
+        compress=None,
+        lazy_cores=True,
+        max_steps=5,
+        profile="default",
+        threads=None,
+    ):
+        super().__init__(
+            cores=cores,
+            out=out,
+            quiet=quiet,
+            compress=compress,
+            lazy_cores=lazy_cores,
+            profile=profile,
+            threads=threads,
+        )
+        self.max_steps = max_steps
+        self.control = None
+        self.logic_programs = None
+        self.statements = None
+        self.loaded = False
+        self.reused = False
+        self.step = 0
+        self.steps = 0
+
+        # Time to create controls and add logic programs, and the counts
+        self.load_time = 0.0
+        self.loads = 0
+        self.solves = 0
+
+        # Wall time for each solve, and if it started with a reused control
+        self.times = []
+
+    def solve(self, setup, *args, **kwargs):
+        """
+        Run the solve, and keep the wall time it took.
+        """
+        if kwargs.get("facts_only"):
+            return super().solve(setup, *args, **kwargs)
+        start = time.perf_counter()
+        self.reused = None
+        result = super().solve(setup, *args, **kwargs)
+        self.times.append((time.perf_counter() - start, self.reused))
+        return result
+
+    def init_control(self, logic_programs):
+        """
+        Reuse the control if we can, otherwise start a new one.
+        """
+        self.step += 1
+        self.solves += 1
+        reused = not (
+            self.control is None
+            or self.logic_programs != logic_programs
+            or self.steps >= self.max_steps
+        )
+        if not reused:
+            self.control = None
+            start = time.perf_counter()
+            self.control = super().init_control(logic_programs)
+            self.load_time += time.perf_counter() - start
+            self.loaded = False
+            self.steps = 0
+        self.steps += 1
+
+        # A solve again for cores counts with the first
+        if self.reused is None:
+            self.reused = reused
+
+        # The external for this step is true until we finish
+        self.step_symbol = clingo.Number(self.step)
+        with self.control.backend() as backend:
+            self.active = backend.add_atom(
+                clingo.Function(step_atom, [self.step_symbol])
+            )
+            backend.add_external(self.active, clingo.TruthValue.True_)
+        return self.control
+
+    def add_fact(self, symbol):
+        """
+        Add a fact (a rule guarded by the external for the step).
+        """
+        arguments = [self.step_symbol] + list(symbol.arguments)
+        self.add_step_fact(clingo.Function(symbol.name, arguments, symbol.positive))
+
+    def add_step_fact(self, symbol):
+        """
+        Add a fact that already has the step as the first argument.
+        """
+        atom = self.backend.add_atom(symbol)
+        self.backend.add_rule([atom], [self.active], choice=self.choices)
+        if self.choices:
+            self.assumptions.append(atom)
+
+    def facts(self, rows, prefix=()):
+        """
+        Add facts from (name, arguments) tuples, with the step first.
+
+        The step is added as we make each symbol, so we don't make it twice.
+        """
+        if self.backend is None:
+            return super().facts(rows, prefix)
+        symbols = [argify(arg) for arg in prefix]
+        step = [self.step_symbol] + symbols
+        for name, arguments in rows:
+            arguments = [argify(arg) for arg in arguments]
+            if self.out is not None:
+                self.out.write("%s.\n" % clingo.Function(name, symbols + arguments))
+            self.add_step_fact(clingo.Function(name, step + arguments))
+
+    def load(self, logic_programs):
+        """
+        Add the rewritten logic programs to a new control.
+
+        The programs are parsed and rewritten only when they change, and the
+        statements are added to each new control without parsing them again.
+        """
+        if self.loaded:
+            return
+        if self.statements is None or self.logic_programs != logic_programs:
+            transformer = StepTransformer()
+            self.statements = []
+            clingo.ast.parse_files(
+                logic_programs,
+                lambda statement: self.statements.append(transformer(statement)),
+            )
+            self.logic_programs = logic_programs
+
+        start = time.perf_counter()
+        with clingo.ast.ProgramBuilder(self.control) as builder:
+            for statement in self.statements:
+                builder.add(statement)
+        self.load_time += time.perf_counter() - start
+        self.loaded = True
+        self.loads += 1
+
+    def ground(self):
+        self.control.ground([(step_part, [self.step_symbol])])
+
+    def shown(self, symbol):
+        """
+        Remove the step from a symbol (None if it is from another step)
+        """
+        arguments = symbol.arguments
+        if symbol.name == step_atom:
+            return
+        if not arguments or arguments[0] != self.step_symbol:
+            return
+        return clingo.Function(symbol.name, arguments[1:], symbol.positive)
+
+    def finish(self):
+        """
+        Release the external for the step, removing its facts and rules.
+        """
+        self.control.release_external(clingo.Function(step_atom, [self.step_symbol]))
+        self.control.cleanup()
+
+    def report(self):
+        """
+        Report the wall time of the solves, with a new control and reusing one.
+
+        Times are measured for each solve (setup, grounding, search and any
+        solve again for cores), so compare the total with a PyclingoDriver
+        over the same diffs to see if reuse pays off.
+        """
+
+        def average(times):
+            return sum(times) / len(times) if times else None
+
+        new = [seconds for seconds, reused in self.times if not reused]
+        reused = [seconds for seconds, reused in self.times if reused]
+        report = {
+            "solves": len(self.times),
+            "loads": self.loads,
+            "load_time": self.load_time,
+            "total": sum(new) + sum(reused),
+            "new_control": average(new),
+            "reused": average(reused),
+        }
+        logger.info(
+            "%s solves took %.3f seconds, %s with a new control and %s reusing one"
+            % (report["solves"], report["total"], len(new), len(reused))
+        )
+        return report
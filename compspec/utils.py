@@ -2,6 +2,8 @@ __author__ = "Vanessa Sochat"
 __copyright__ = "Copyright 2022-2024, Vanessa Sochat"
 __license__ = "MIT"
 
+import gzip
+import io
 import json
 import os
 import re
@@ -23,6 +25,21 @@ def read_file(filename):
     return data
 
 
+def open_output(filename, compress=None, buffering=1024 * 1024):
+    """
+    Open a text file for buffered writing.
+
+    The file is gzip compressed if compress is True, or if it is None
+    (the default) and the filename ends in .gz.
+    """
+    if compress is None:
+        compress = str(filename).endswith(".gz")
+    if compress:
+        raw = gzip.open(filename, "wb", compresslevel=6)
+        return io.TextIOWrapper(io.BufferedWriter(raw, buffer_size=buffering))
+    return open(filename, "w", buffering=buffering)
+
+
 def write_json(data, filename):
     with open(filename, "w") as fd:
         fd.write(json.dumps(data, indent=4))
@@ -56,6 +56,9 @@ class DwarfGraph(compspec.graph.Graph):
     def __init__(self, lib, scope=None):
         self.corpus = Corpus(lib)
         super().__init__()
+
+        # Lookup of die offset to node id, for dies we have added
+        self.lookup = {}
         self.type_lookup = self.corpus.get_type_lookup()
         self.children_lookup = {}
         self._prepare_location_parser()
@@ -494,10 +497,9 @@ class DwarfGraph(compspec.graph.Graph):
         )
 
         # Just generate relation for path logic!
-        relation = self.new_relation(
+        self.new_relation(
             fromid=self.ids[die.get_parent()], toid=node.nodeid, relation="has"
         )
-        self.add_relation(relation)
 
         self.gen(
             "type", underlying_type, parent=self.ids[die], is_connector=is_connector
@@ -15,6 +15,7 @@ import sys
 import pytest
 
 import compspec.utils as utils
+from compspec.asp import Difference
 
 here = os.path.abspath(os.path.dirname(__file__))
 sys.path.insert(0, here)
@@ -94,3 +95,15 @@ def test_examples(tmp_path, name, lib1, lib2):
                     sys.exit(
                         "Missing %s value:\n%s" % (key, json.dumps(value, indent=4))
                     )
+
+
+@pytest.mark.parametrize("name,lib1,lib2", tests)
+def test_native_parity(name, lib1, lib2):
+    result, runner = run(name, lib1, lib2)
+
+    # The native engine should give the same result as clingo
+    A, B = runner.facts.A, runner.facts.B
+    native = Difference(A, B, "A", "B", quiet=True, engine="native").run()
+    assert {k: sorted(v) for k, v in native.items()} == {
+        k: sorted(v) for k, v in result.items()
+    }
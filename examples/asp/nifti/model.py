@@ -23,18 +23,28 @@ class NiftiGraphs(compspec.graph.GraphGroup):
     def extract(self):
         """
         Extract named groups into different graphs
+
+        The header is tested first so we can stop if there are differences,
+        and the image graph (a node for every voxel) is only built if we get to it.
+        """
+        self.add_builder("header", self.extract_header)
+        self.add_builder("image", self.extract_image)
+
+    def extract_header(self):
+        """
+        Create the graph for the header.
         """
-        # First try just the header
         g = compspec.graph.Graph()
         root = g.new_node("brainmap", self.ns)
 
         for k, v in self.nii.header.items():
             g.gen(k, str(v), parent=root.nodeid)
+        return g
 
-        # Save the named graph - the header is tested first so we can stop
-        # if there are differences.
-        self.graphs["header"] = g
-
+    def extract_image(self):
+        """
+        Create the graph for the image data.
+        """
         g = compspec.graph.Graph()
         root = g.new_node("brainmap", self.ns)
 
@@ -43,14 +53,21 @@ class NiftiGraphs(compspec.graph.GraphGroup):
         data = self.nii.get_data()
 
         # Since we cannot represent floats, we need to apply scale
-        # Yes this isn't precise, it's an example
+        # Yes this isn't precise, it's an example. There is a node for every
+        # voxel and value, so we load them in bulk.
+        nodes = []
+        relations = []
         for x in range(data.shape[0]):
             for y in range(data.shape[1]):
                 for z in range(data.shape[2]):
-                    voxel, _ = g.gen("voxel", f"{x}.{y}.{z}", parent=root.nodeid)
-                    g.gen("value", int(data[x, y, z] * 100), parent=voxel.nodeid)
-
-        self.graphs["image"] = g
+                    voxel = g.next()
+                    value = g.next()
+                    nodes.append((voxel, "voxel", f"{x}.{y}.{z}"))
+                    nodes.append((value, "value", int(data[x, y, z] * 100)))
+                    relations.append((root.nodeid, "has", voxel))
+                    relations.append((voxel, "has", value))
+        g.bulk_load(nodes, relations)
 
         # 1. subtracts the images
         # 2. counts every time the absolute difference is greater than the default tolerance (default 1e-8)
+        return g
@@ -47,6 +47,11 @@ def main():
             print(f"Result for group '{group}'")
             print(json.dumps(result, indent=4))
 
+            # The image graph is only built if the headers match
+            if group == "header" and result:
+                print("Headers differ, stopping.")
+                break
+
 
 if __name__ == "__main__":
     main()
@@ -1,5 +1,6 @@
 # This is the base model for deriving facts from ast in json
 
+import functools
 import json
 
 import compspec.graph
@@ -18,45 +19,50 @@ class AstGraphs(compspec.graph.GraphGroup):
         self.module_name = module_name
         super().__init__()
 
+    @property
+    def version(self):
+        # We should have only one version!
+        assert len(self.ast) == 1
+        return list(self.ast.keys())[0]
+
     def extract(self):
         """
         Extract named groups into different graphs
+
+        Each graph is built when it is first asked for.
         """
-        # We should have only one version!
-        assert len(self.ast) == 1
-        version = list(self.ast.keys())[0]
+        for group in ["module", "function", "parameter"]:
+            self.add_builder(group, functools.partial(self.extract_group, group))
 
-        # Initialize groups
-        groups = ["module", "function", "parameter"]
+    def extract_group(self, group):
+        """
+        Create the graph for one group.
+        """
+        version = self.version
+        g = compspec.graph.Graph()
 
-        # Create a graph for each group
-        for group in groups:
-            g = compspec.graph.Graph()
+        # Create the root of the library (single root)
+        root = g.new_node("module", self.module_name)
 
-            # Create the root of the library (single root)
-            root = g.new_node("module", self.module_name)
+        # The version of the library
+        g.gen("version", version, parent=root.nodeid)
 
-            # The version of the library
-            g.gen("version", version, parent=root.nodeid)
+        for submod_name, items in self.ast[version].items():
+            submod, _ = g.gen("module", submod_name, parent=root.nodeid)
 
-            for submod_name, items in self.ast[version].items():
-                submod, _ = g.gen("module", submod_name, parent=root.nodeid)
+            # Module graph doesn't include anything else
+            if group == "module":
+                continue
 
-                # Module graph doesn't include anything else
-                if group == "module":
+            for funcname, params in items.items():
+                func, _ = g.gen("function", funcname, parent=submod.nodeid)
+                if group == "function":
                     continue
 
-                for funcname, params in items.items():
-                    func, _ = g.gen("function", funcname, parent=submod.nodeid)
-                    if group == "function":
-                        continue
-
-                    for order, param in enumerate(params):
-                        g.gen("parameter", param, parent=func.nodeid)
-                        g.gen("order", order, parent=func.nodeid)
-
-            # Save the named graph
-            self.graphs[group] = g
+                for order, param in enumerate(params):
+                    g.gen("parameter", param, parent=func.nodeid)
+                    g.gen("order", order, parent=func.nodeid)
+        return g
 
 
 class AstModuleGraphs(AstGraphs):
@@ -68,26 +74,28 @@ class AstModuleGraphs(AstGraphs):
         """
         Extract named groups into different graphs
         """
-        # We should have only one version!
-        assert len(self.ast) == 1
-        version = list(self.ast.keys())[0]
-
         # Each module will be a root
-        for submod_name, items in self.ast[version].items():
-            # Create a new graph
-            g = compspec.graph.Graph()
+        for submod_name, items in self.ast[self.version].items():
+            self.add_builder(
+                submod_name,
+                functools.partial(self.extract_module, submod_name, items),
+            )
 
-            # The module is the quasi root
-            submod = g.new_node("module", submod_name)
+    def extract_module(self, submod_name, items):
+        """
+        Create the graph for one module.
+        """
+        g = compspec.graph.Graph()
 
-            for funcname, params in items.items():
-                func, _ = g.gen("function", funcname, parent=submod.nodeid)
-                for order, param in enumerate(params):
-                    g.gen("parameter", param, parent=func.nodeid)
-                    g.gen("order", order, parent=func.nodeid)
+        # The module is the quasi root
+        submod = g.new_node("module", submod_name)
 
-            # Save the named graph
-            self.graphs[submod_name] = g
+        for funcname, params in items.items():
+            func, _ = g.gen("function", funcname, parent=submod.nodeid)
+            for order, param in enumerate(params):
+                g.gen("parameter", param, parent=func.nodeid)
+                g.gen("order", order, parent=func.nodeid)
+        return g
 
 
 class AstFunctionGraphs(AstGraphs):
@@ -99,23 +107,24 @@ class AstFunctionGraphs(AstGraphs):
         """
         Extract named groups into different graphs
         """
-        # We should have only one version!
-        assert len(self.ast) == 1
-        version = list(self.ast.keys())[0]
-
-        # Each module will be a root
-        for submod_name, items in self.ast[version].items():
+        # Each function in each module will be a root
+        for items in self.ast[self.version].values():
             for funcname, params in items.items():
-                # Create a new graph
-                g = compspec.graph.Graph()
+                self.add_builder(
+                    funcname,
+                    functools.partial(self.extract_function, funcname, params),
+                )
 
-                root = g.new_node("function", funcname)
-                for order, param in enumerate(params):
-                    g.gen("parameter", param, parent=root.nodeid)
-                    g.gen("order", order, parent=root.nodeid)
-
-                # Save the named graph
-                self.graphs[funcname] = g
+    def extract_function(self, funcname, params):
+        """
+        Create the graph for one function.
+        """
+        g = compspec.graph.Graph()
+        root = g.new_node("function", funcname)
+        for order, param in enumerate(params):
+            g.gen("parameter", param, parent=root.nodeid)
+            g.gen("order", order, parent=root.nodeid)
+        return g
 
 
 def run(lib1, lib2, GraphClass=AstGraphs):
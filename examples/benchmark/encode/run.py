@@ -0,0 +1,103 @@
+import argparse
+import json
+import random
+import resource
+import subprocess
+import sys
+import time
+
+from compspec.asp import Difference
+from compspec.graph import Graph
+
+
+def build(size, shape, changes=3, seed=0):
+    """
+    Build a graph of size nodes, as a chain ("deep", so paths get long) or a
+    tree with eight children per node ("wide", so paths stay short).
+    """
+    rnd = random.Random(seed)
+    names = ["function", "parameter", "type", "member"]
+    changed = set(rnd.sample(range(1, size), changes))
+    g = Graph()
+    g.new_node("library", "libexample.so", "id0")
+    for i in range(1, size):
+        value = f"{names[i % len(names)]}_{i % 17}"
+        if i in changed:
+            value = "changed"
+        g.new_node(names[i % len(names)], value, f"id{i}")
+        parent = i - 1 if shape == "deep" else (i - 1) // 8
+        g.new_relation(f"id{parent}", "has", f"id{i}")
+    return g
+
+
+def run_one(size, shape, encode):
+    """
+    Run one diff, and print its time and our peak memory as json.
+    """
+    A = build(size, shape)
+    B = build(size, shape, seed=1)
+    paths = [node[-1] for node in A.iter_nodes()]
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    result = Difference(A, B, quiet=True, encode=encode).run()
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(
+        json.dumps(
+            {
+                "path_chars": max(len(path) for path in paths),
+                "seconds": elapsed,
+                "peak_mb": peak / 1024,
+                "diff_mb": (peak - before) / 1024,
+                "answers": {k: sorted(map(str, v)) for k, v in result.items()},
+            }
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Encoded facts benchmark")
+    parser.add_argument("--sizes", default="500,2000", help="nodes per graph")
+    parser.add_argument("--one", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.one:
+        size, shape, encode = args.one
+        return run_one(int(size), shape, encode == "encode")
+
+    # Each diff runs in its own process, so the peak memory is its own
+    print(
+        "| Shape | Nodes | Longest Path | Encode | Time (s) | Peak (MB) | Diff (MB) |"
+    )
+    print(
+        "|-------|-------|--------------|--------|----------|-----------|-----------|"
+    )
+    for size in [int(x) for x in args.sizes.split(",")]:
+        for shape in "wide", "deep":
+            rows = {}
+            for encode in "plain", "encode":
+                out = subprocess.run(
+                    [sys.executable, __file__, "--one", str(size), shape, encode],
+                    check=True,
+                    capture_output=True,
+                    text=True,
+                ).stdout
+                rows[encode] = row = json.loads(out.strip().splitlines()[-1])
+                print(
+                    "| %s | %s | %s | %s | %.3f | %.1f | %.1f |"
+                    % (
+                        shape,
+                        size,
+                        row["path_chars"],
+                        encode == "encode",
+                        row["seconds"],
+                        row["peak_mb"],
+                        row["diff_mb"],
+                    )
+                )
+
+            # The encoding must not change the answers
+            assert rows["plain"]["answers"] == rows["encode"]["answers"]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import contextlib
+import os
+import sys
+import time
+
+import clingo
+
+import compspec.solver
+from compspec.asp import Composition
+from compspec.asp.base import FactGenerator
+from compspec.graph import Graph
+from compspec.solver import fn
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(here, "..", "graph-memory"))
+from run import build  # noqa
+
+
+class AspFunctionFacts(FactGenerator):
+    """
+    Generate facts one AspFunction at a time (as compspec did before the
+    batched fact API).
+    """
+
+    def generate_facts(self, g, ns, skip=None):
+        for relation in g.iter_relations():
+            self.gen.fact(fn.relation(ns, *relation))
+        for node in g.iter_connectors():
+            self.gen.fact(fn.is_connector(ns, node))
+        for node in g.iter_nodes():
+            self.gen.fact(fn.node(ns, *node))
+            self.gen.fact(fn.path(ns, node[-1]))
+
+
+@contextlib.contextmanager
+def uncached():
+    """
+    Convert every argument to a symbol without the cache.
+    """
+    argify = compspec.solver.argify
+    compspec.solver.argify = compspec.solver._argify.__wrapped__
+    try:
+        yield
+    finally:
+        compspec.solver.argify = argify
+
+
+def measure(g, batched=True, cached=True):
+    """
+    Time only the fact generation (no grounding or solve).
+    """
+    comp = Composition(g, quiet=True)
+    if not batched:
+        comp.facts.generate_facts = AspFunctionFacts.generate_facts.__get__(comp.facts)
+    compspec.solver._argify.cache_clear()
+    context = contextlib.nullcontext() if cached else uncached()
+    with context:
+        start = time.perf_counter()
+        # Facts are added to a control (as for a solve) without grounding
+        control = clingo.Control()
+        with control.backend() as backend:
+            comp.driver.backend = backend
+            comp.driver.choices = False
+            comp.facts.setup(comp.driver)
+        comp.driver.backend = None
+        elapsed = time.perf_counter() - start
+    return elapsed, sum(1 for _ in comp.facts.iter_facts(g)) + 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fact generation benchmark")
+    parser.add_argument("--sizes", default="10000,100000", help="node counts")
+    args = parser.parse_args()
+
+    print("| Facts API | Symbol Cache | Nodes | Facts | Time (s) | Facts/s |")
+    print("|-----------|--------------|-------|-------|----------|---------|")
+    for size in [int(x) for x in args.sizes.split(",")]:
+        g = build(Graph, size)
+        for batched, cached in (False, False), (False, True), (True, True):
+            elapsed, count = measure(g, batched=batched, cached=cached)
+            print(
+                "| %s | %s | %s | %s | %.3f | %d |"
+                % (
+                    "batched" if batched else "AspFunction",
+                    "yes" if cached else "no",
+                    size,
+                    count,
+                    elapsed,
+                    count / elapsed,
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
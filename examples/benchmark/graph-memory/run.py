@@ -0,0 +1,129 @@
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+
+from compspec.columnar import ColumnarGraph
+from compspec.graph import Graph
+
+
+def build(GraphClass, size, fanout=8):
+    """
+    Build a synthetic graph shaped like a type tree (a DWARF or spack graph).
+
+    Each node has a name from a small vocabulary (like a DIE tag) and a value
+    that is often repeated (like a size or type name).
+    """
+    g = GraphClass()
+    root = g.new_node("library", "libexample.so")
+    parents = [root.nodeid]
+    names = ["function", "parameter", "type", "size", "member", "variable"]
+    count = 1
+    while count < size:
+        next_parents = []
+        for parent in parents:
+            for i in range(fanout):
+                if count >= size:
+                    break
+                name = names[count % len(names)]
+                value = f"{name}_{count % 97}" if name != "size" else count % 64
+                node, _ = g.gen(name, value, parent=parent)
+                next_parents.append(node.nodeid)
+                count += 1
+        parents = next_parents
+    return g
+
+
+def rows(size, fanout=8):
+    """
+    Generate the same shape of graph as node and relation tuples, for bulk_load.
+    """
+    names = ["function", "parameter", "type", "size", "member", "variable"]
+    nodes = [("id0", "library", "libexample.so")]
+    relations = []
+    for count in range(1, size):
+        name = names[count % len(names)]
+        value = f"{name}_{count % 97}" if name != "size" else count % 64
+        nodes.append((f"id{count}", name, value))
+        relations.append((f"id{(count - 1) // fanout}", "has", f"id{count}"))
+    return nodes, relations
+
+
+def measure_bulk(GraphClass, nodes, relations):
+    """
+    Measure the time to bulk load a graph.
+    """
+    gc.collect()
+    start = time.perf_counter()
+    g = GraphClass()
+    g.bulk_load(nodes, relations)
+    return g, time.perf_counter() - start
+
+
+def measure(GraphClass, size):
+    """
+    Measure the memory retained by a graph, and the time to build it.
+    """
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    g = build(GraphClass, size)
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return g, current, peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Graph memory benchmark")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="node counts")
+    parser.add_argument(
+        "--bulk-sizes", default="1000000", help="node counts to bulk load"
+    )
+    args = parser.parse_args()
+
+    print("| Backend | Nodes | Retained (MB) | Bytes/Node | Peak (MB) | Build (s) |")
+    print("|---------|-------|---------------|------------|-----------|-----------|")
+    for size in [int(x) for x in args.sizes.split(",")]:
+        graphs = []
+        for GraphClass in Graph, ColumnarGraph:
+            g, current, peak, elapsed = measure(GraphClass, size)
+            graphs.append(g)
+            print(
+                "| %s | %s | %.2f | %d | %.2f | %.3f |"
+                % (
+                    GraphClass.__name__,
+                    size,
+                    current / 1e6,
+                    current / size,
+                    peak / 1e6,
+                    elapsed,
+                )
+            )
+
+        # Both layouts must produce the same facts
+        A, B = graphs
+        assert list(A.iter_nodes()) == list(B.iter_nodes())
+        assert list(A.iter_relations()) == list(B.iter_relations())
+        del graphs, A, B
+
+    # Relations are shuffled, so paths can't be computed as they are added
+    print()
+    print("| Backend | Nodes | Bulk Load (s) |")
+    print("|---------|-------|---------------|")
+    for size in [int(x) for x in args.bulk_sizes.split(",") if x]:
+        nodes, relations = rows(size)
+        random.Random(0).shuffle(relations)
+        graphs = []
+        for GraphClass in Graph, ColumnarGraph:
+            g, elapsed = measure_bulk(GraphClass, nodes, relations)
+            graphs.append(g)
+            print("| %s | %s | %.3f |" % (GraphClass.__name__, size, elapsed))
+        A, B = graphs
+        assert list(A.iter_nodes()) == list(B.iter_nodes())
+        del graphs, A, B, nodes, relations
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import argparse
+import random
+import time
+
+from compspec.asp import Difference
+from compspec.graph import Graph
+from compspec.solver import PersistentPyclingoDriver
+
+
+def build(seed, size, changes=0):
+    """
+    Build a small random tree, optionally with a few changed values.
+    """
+    rnd = random.Random(seed)
+    names = ["function", "parameter", "type", "size"]
+    g = Graph()
+    g.new_node("library", "libexample.so", "id0")
+    changed = set(rnd.sample(range(1, size), changes))
+    for i in range(1, size):
+        value = rnd.choice(["int", "char", "float", 8])
+        if i in changed:
+            value = "double"
+        g.new_node(names[i % len(names)], value, f"id{i}")
+        g.new_relation(f"id{rnd.randrange(i)}", "has", f"id{i}")
+    return g
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-shot driver benchmark")
+    parser.add_argument("--diffs", default=100, type=int, help="number of diffs")
+    parser.add_argument("--size", default=50, type=int, help="nodes per graph")
+    args = parser.parse_args()
+
+    pairs = [
+        (build(seed, args.size), build(seed, args.size, changes=3))
+        for seed in range(args.diffs)
+    ]
+
+    # A new control (and parse of is-compatible.lp) for every diff
+    start = time.perf_counter()
+    fresh = [Difference(A, B, quiet=True).run() for A, B in pairs]
+    fresh_time = time.perf_counter() - start
+
+    # One control, with the logic program parsed once
+    driver = PersistentPyclingoDriver()
+    start = time.perf_counter()
+    persistent = [Difference(A, B, quiet=True, driver=driver).run() for A, B in pairs]
+    persistent_time = time.perf_counter() - start
+    report = driver.report()
+
+    # Both drivers must give the same answers
+    for a, b in zip(fresh, persistent):
+        assert {k: sorted(v) for k, v in a.items()} == {
+            k: sorted(v) for k, v in b.items()
+        }
+
+    print("| Driver | Diffs | Total (s) | Per Diff (ms) |")
+    print("|--------|-------|-----------|---------------|")
+    for name, elapsed in ("PyclingoDriver", fresh_time), (
+        "PersistentPyclingoDriver",
+        persistent_time,
+    ):
+        print(
+            "| %s | %s | %.3f | %.2f |"
+            % (name, args.diffs, elapsed, elapsed * 1000 / args.diffs)
+        )
+    print()
+    print(
+        "Loaded logic programs %s times for %s solves (%.3f seconds)"
+        % (report["loads"], report["solves"], report["load_time"])
+    )
+    print(
+        "Per solve: %.2f ms with a new control, %.2f ms reusing one"
+        % (report["new_control"] * 1000, (report["reused"] or 0) * 1000)
+    )
+    print(
+        "Persistent vs new driver: %.3f seconds (%+.1f%%)"
+        % (persistent_time - fresh_time, 100 * (persistent_time / fresh_time - 1))
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+# Copyright (C) 2022 Vanessa Sochat.
+
+# This Source Code Form is subject to the terms of the
+# Mozilla Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import os
+import sys
+
+import pytest
+
+here = os.path.abspath(os.path.dirname(__file__))
+spack = os.path.join(os.path.dirname(here), "examples", "asp", "spack")
+sys.path.insert(0, spack)
+from model import SpackGraphs  # noqa: E402
+
+# Pairs of specs to compare (package, spec A, spec B)
+pairs = [
+    ("python", "python/python2.7.json", "python/python3.8.json"),
+    ("singularity", "singularity/singularity.json", "singularity/singularity-ce.json"),
+]
+
+
+class Specs:
+    """
+    A pair of spack specs, with a graph (A and B) for each.
+    """
+
+    model = SpackGraphs
+
+    def __init__(self, package, lib1, lib2):
+        self.package = package
+        self.files = [os.path.join(spack, "lib", lib) for lib in (lib1, lib2)]
+        self.A, self.B = [self.load(filename) for filename in self.files]
+
+    def load(self, filename, package=None):
+        package = package or self.package
+        return self.model(filename, package)[package]
+
+
+@pytest.fixture(params=pairs, ids=[x[0] for x in pairs])
+def specs(request):
+    """
+    Each pair of specs, loaded again for every test.
+    """
+    return Specs(*request.param)
@@ -0,0 +1,26 @@
+# Copyright (C) 2022 Vanessa Sochat.
+
+# This Source Code Form is subject to the terms of the
+# Mozilla Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import compspec.graph
+
+
+def normalize(result):
+    """
+    Results are lists of facts, and the order can vary between engines.
+    """
+    return {key: sorted(values) for key, values in (result or {}).items()}
+
+
+def make_graph(nodes, graph=compspec.graph.Graph):
+    """
+    Make a graph from (nodeid, name, value, parent), parents first.
+    """
+    g = graph()
+    for nodeid, name, value, parent in nodes:
+        g.new_node(name, value, nodeid=nodeid)
+        if parent is not None:
+            g.new_relation(parent, "has", nodeid)
+    return g
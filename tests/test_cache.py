@@ -0,0 +1,88 @@
+# Copyright (C) 2022 Vanessa Sochat.
+
+# This Source Code Form is subject to the terms of the
+# Mozilla Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from compspec.asp import Difference
+from compspec.cache import GraphCache, ResultCache, content_hash
+
+
+def test_graph_cache(specs, tmp_path):
+    cache = GraphCache(tmp_path)
+    extracted = []
+
+    class CountedGraphs(specs.model):
+        def extract(self):
+            extracted.append(self.package)
+            super().extract()
+
+    # The second time we load the group from the cache
+    filename = specs.files[0]
+    for _ in range(2):
+        group = cache.extract(CountedGraphs, filename, specs.package)
+    assert len(extracted) == 1
+    assert list(group[specs.package].iter_nodes()) == list(specs.A.iter_nodes())
+
+    # Other arguments (or inputs) are other entries, and old ones are evicted
+    cache.extract(CountedGraphs, filename, "other")
+    cache.extract(CountedGraphs, specs.files[1], specs.package)
+    assert len(extracted) == 3 and len(cache.entries()) == 3
+    cache.max_size = 1
+    cache.evict()
+    assert not cache.entries()
+
+
+def test_result_cache(specs, tmp_path):
+    A, B = specs.A, specs.B
+    cache = ResultCache(tmp_path)
+
+    # The second run is from memory, and a new cache reads it from disk
+    answers = []
+    for cache in cache, cache, ResultCache(tmp_path):
+        diff = Difference(A, B, quiet=True, cache=cache)
+        answers.append(diff.run())
+    assert answers[0] == answers[1] == answers[2]
+    assert diff.result.cached and diff.result.satisfiable
+
+    # Other namespaces (or graphs, or logic programs) are solved
+    diff = Difference(A, B, "X", "Y", quiet=True, cache=cache)
+    diff.run()
+    assert not diff.result.cached
+    assert len(cache.entries()) == 2
+
+
+def test_result_cache_copies(specs):
+    cache = ResultCache(disk=False)
+    diff = Difference(specs.A, specs.B, quiet=True, cache=cache)
+    expected = diff.run()
+    assert expected
+
+    # Changing the answers we get (solved or cached) does not change the cache
+    for _ in range(2):
+        answers = diff.run()
+        assert answers == expected
+        answers.clear()
+    expected.clear()
+    assert diff.run() and diff.result.cached
+
+
+def test_content_hash_directory(tmp_path):
+    inputs = tmp_path / "inputs"
+    (inputs / "sub").mkdir(parents=True)
+    (inputs / "a.json").write_text("a")
+    (inputs / "sub" / "b.json").write_text("b")
+    digest = content_hash(inputs)
+    assert digest == content_hash(str(inputs))
+
+    # So a graph extracted from a directory can be cached
+    key = GraphCache(tmp_path / "cache").key(GraphCache, inputs)
+    assert key == GraphCache(tmp_path / "cache").key(GraphCache, str(inputs))
+
+    # A change to the content (or a name) of any file changes the hash
+    (inputs / "sub" / "b.json").write_text("c")
+    assert content_hash(inputs) != digest
+    (inputs / "sub" / "b.json").write_text("b")
+    assert content_hash(inputs) == digest
+    (inputs / "a.json").rename(inputs / "c.json")
+    assert content_hash(inputs) != digest
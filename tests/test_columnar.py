@@ -0,0 +1,122 @@
+# Copyright (C) 2022 Vanessa Sochat.
+
+# This Source Code Form is subject to the terms of the
+# Mozilla Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import pytest
+
+from compspec.asp import Difference
+from compspec.columnar import ColumnarGraph, CompactPathTrie, NodeIds, StringTable
+
+from .helpers import make_graph, normalize
+
+
+def columnar(g):
+    """
+    Rebuild a graph as a ColumnarGraph, in the order it was built.
+    """
+    copy = ColumnarGraph()
+    for node in g.nodes.values():
+        copy.add_node(node)
+    for relation in g.relations:
+        copy.add_relation(relation)
+    return copy
+
+
+def test_columnar_parity(specs):
+    A, B = columnar(specs.A), columnar(specs.B)
+
+    # The columns produce the same facts as the dict of objects
+    for g, expected in (A, specs.A), (B, specs.B):
+        assert list(g.iter_nodes()) == list(expected.iter_nodes())
+        assert list(g.iter_relations()) == list(expected.iter_relations())
+        assert list(g.iter_connectors()) == list(expected.iter_connectors())
+        assert g.to_dict() == expected.to_dict()
+        assert g.fingerprint() == expected.fingerprint()
+        assert g.subtree_hashes() == expected.subtree_hashes()
+
+    # Loading from a dict gives the same graph too
+    loaded = ColumnarGraph.from_dict(specs.A.to_dict())
+    assert sorted(loaded.iter_nodes()) == sorted(specs.A.iter_nodes())
+
+    # And so the same diff
+    expected = Difference(specs.A, specs.B, quiet=True).run()
+    assert normalize(Difference(A, B, quiet=True).run()) == normalize(expected)
+
+
+def test_columnar_interface():
+    g = make_graph(
+        [("a", "library", "libfoo.so", None), ("b", "function", "foo", "a")],
+        graph=ColumnarGraph,
+    )
+
+    # Nodes are generated on demand, and missing ones raise a KeyError
+    assert g.nodes["b"].name == "function" and g.nodes["b"].value == "foo"
+    assert list(g.nodes) == ["a", "b"] and len(g.nodes) == 2
+    assert "c" not in g.nodes
+    with pytest.raises(KeyError):
+        g.nodes["c"]
+    assert g.path("b") == "library:libfoo.so->function:foo"
+    assert g.path("c") == ""
+
+    # Adding a node id again replaces it, and a relation again does nothing
+    g.new_node("function", "bar", nodeid="b")
+    g.new_relation("a", "has", "b")
+    assert list(g.iter_nodes())[1][:3] == ("b", "function", "bar")
+    assert len(g.relations) == 1
+    assert g.has_relation("a", "has", "b") and not g.has_relation("a", "has", "c")
+
+
+def test_string_table():
+    table = StringTable()
+
+    # Scalars of different types are distinct symbols
+    indices = [table.intern(x) for x in ("1", 1, True, "1")]
+    assert indices == [0, 1, 2, 0]
+    assert table[1] == 1 and table[2] is True
+    assert True in table and 2 not in table
+
+    # Unhashable values are kept, but not deduplicated
+    assert table.intern([1]) != table.intern([1])
+    assert table.get([1]) is None
+
+
+def test_node_ids():
+    ids = NodeIds()
+
+    # Counter ids are not stored, the row is in the id
+    assert [ids.intern(f"id{i}") for i in range(3)] == [0, 1, 2]
+    assert ids.table is None and ids.get("id1") == 1 and ids[2] == "id2"
+    for nodeid in "id3", "id01", "id-1", "x", 1:
+        assert ids.get(nodeid) is None
+
+    # Any other id moves them all into a table
+    assert ids.intern("id1") == 1 and ids.table is None
+    assert ids.intern("root") == 3 and ids.table is not None
+    assert list(ids) == ["id0", "id1", "id2", "root"]
+    assert ids.get("id1") == 1 and ids.get("root") == 3
+
+
+def test_compact_path_trie():
+    trie = CompactPathTrie()
+    refs = [trie.add(f"type:{i}", trie.add("library:a")) for i in range(100)]
+
+    # Paths are shared, and found again after the table grows
+    assert len(trie.slots) >= 2 * len(trie.parents)
+    assert [trie.add(f"type:{i}", trie.add("library:a")) for i in range(100)] == refs
+    assert trie.path(refs[5]) == "library:a->type:5"
+
+
+def test_columnar_relations():
+    g = ColumnarGraph()
+    g.bulk_load(
+        [("a", "library", "a"), ("b", "type", "b"), ("c", "type", "c")],
+        [("a", "has", "c"), ("b", "has", "c"), ("a", "uses", "c"), ("b", "has", "c")],
+    )
+
+    # A node with more than one relation into it finds each of them
+    assert len(g.relations) == 3
+    assert g.has_relation("a", "has", "c") and g.has_relation("b", "has", "c")
+    assert g.has_relation("a", "uses", "c") and not g.has_relation("b", "uses", "c")
+    assert not g.has_relation("c", "has", "a")
@@ -0,0 +1,156 @@
+# Copyright (C) 2022 Vanessa Sochat.
+
+# This Source Code Form is subject to the terms of the
+# Mozilla Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import random
+
+import pytest
+
+from compspec.asp import Difference, StagedDifference, batch_diff
+
+from .helpers import make_graph, normalize
+
+
+@pytest.mark.parametrize("prune", [False, True])
+def test_native_parity(specs, prune):
+    # Each direction should match the clingo engine exactly
+    for gA, gB in [(specs.A, specs.B), (specs.B, specs.A)]:
+        expected = Difference(gA, gB, quiet=True, prune=prune).run()
+        result = Difference(gA, gB, quiet=True, prune=prune, engine="native").run()
+        assert normalize(result) == normalize(expected)
+
+
+def test_batch_diff(specs):
+    pairs = [(specs.A, specs.B), (specs.B, specs.A)]
+
+    # Results can come back in any order, by the index of the pair
+    results = dict(batch_diff(pairs, workers=2))
+    assert sorted(results) == list(range(len(pairs)))
+    for index, (A, B) in enumerate(pairs):
+        expected = Difference(A, B, quiet=True).run()
+        assert normalize(results[index].answers) == normalize(expected)
+
+
+def test_encoded_facts(specs):
+    # Answers are decoded, so they are the same as without the encoding
+    expected = Difference(specs.A, specs.B, quiet=True).run()
+    diff = Difference(specs.A, specs.B, quiet=True, encode=True)
+    assert diff.run() == expected
+    assert len(diff.facts.encoding) > 0
+
+
+@pytest.mark.parametrize("levels", [1, 2, 3])
+def test_staged_parity(specs, levels):
+    # Each direction should match the full difference
+    for gA, gB in [(specs.A, specs.B), (specs.B, specs.A)]:
+        expected = Difference(gA, gB, quiet=True).run()
+        result = StagedDifference(gA, gB, quiet=True, levels=levels).run()
+        assert normalize(result) == normalize(expected)
+
+
+def test_staged_below_changed():
+    # A change below a changed node is found too
+    A = make_graph([("id0", "root", "r", None), ("id1", "a", 2, "id0")])
+    B = make_graph([("id0", "root", "r", None), ("id1", "a", 3, "id0")])
+    for g in A, B:
+        g.gen("a", 1, parent="id1", nodeid="id2")
+    B.gen("c", 1, parent="id2", nodeid="id100")
+    expected = Difference(A, B, quiet=True).run()
+    assert [x[2] for x in expected["added_node"]] == ["id100"]
+    assert normalize(StagedDifference(A, B, quiet=True).run()) == normalize(expected)
+
+
+def test_staged_moved():
+    # Renumbered ids move subtrees that also changed, so we solve in one stage
+    A = make_graph(
+        [
+            ("id0", "root", "r", None),
+            ("id1", "c", 2, "id0"),
+            ("id2", "c", 3, "id0"),
+            ("id3", "a", 2, "id1"),
+            ("id4", "c", 2, "id0"),
+            ("id5", "a", 2, "id3"),
+            ("id6", "b", 3, "id4"),
+            ("id7", "b", 3, "id5"),
+            ("id8", "a", 3, "id2"),
+            ("id9", "b", 3, "id5"),
+            ("id10", "c", 3, "id3"),
+        ]
+    )
+    B = make_graph(
+        [
+            ("id0", "root", "r", None),
+            ("id2", "c", 2, "id0"),
+            ("id3", "c", 3, "id0"),
+            ("id100", "a", 2, "id2"),
+            ("id4", "c", 2, "id0"),
+            ("id5", "a", 3, "id3"),
+            ("id10", "c", 3, "id100"),
+            ("id8", "a", 2, "id10"),
+            ("id7", "b", 3, "id8"),
+            ("id9", "b", 3, "id8"),
+            ("id6", "b", 3, "id4"),
+            ("id1", "c", 1, "id100"),
+        ]
+    )
+    expected = Difference(A, B, quiet=True).run()
+    diff = StagedDifference(A, B, quiet=True, levels=1)
+    assert normalize(diff.run()) == normalize(expected)
+    assert diff.stages == 1
+
+
+def random_edit(rng, nodes):
+    """
+    Change, add, remove or move one node in a tree of (nodeid, name, value, parent)
+    """
+    nodes = list(nodes)
+    i = rng.randrange(1, len(nodes))
+    nodeid, name, value, parent = nodes[i]
+    below = {nodeid}
+    for node in nodes[i + 1 :]:
+        if node[3] in below:
+            below.add(node[0])
+    kind = rng.choice(["change", "add", "remove", "move"])
+    if kind == "change":
+        nodes[i] = (nodeid, name, value % 3 + 1, parent)
+    elif kind == "add":
+        nodes.append(("id100", rng.choice("abc"), 1, rng.choice(nodes)[0]))
+    elif kind == "remove":
+        nodes = [x for x in nodes if x[0] not in below]
+    else:
+        parent = rng.choice([x for x in nodes if x[0] not in below])[0]
+        moved = [x for x in nodes if x[0] in below]
+        nodes = [x for x in nodes if x[0] not in below]
+        nodes.append((nodeid, name, value, parent))
+        nodes += moved[1:]
+    return nodes
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_staged_random_edits(seed):
+    rng = random.Random(seed)
+    for _ in range(10):
+        nodes = [("id0", "root", "r", None)]
+        for i in range(1, rng.randint(3, 20)):
+            parent = rng.choice(nodes)[0]
+            nodes.append((f"id{i}", rng.choice("abc"), rng.randint(1, 3), parent))
+        A, B = make_graph(nodes), make_graph(random_edit(rng, nodes))
+        expected = Difference(A, B, quiet=True).run()
+        result = StagedDifference(A, B, quiet=True, levels=rng.randint(1, 3)).run()
+        assert normalize(result) == normalize(expected)
+
+
+def test_staged_output(specs, tmp_path):
+    # Each stage writes its facts to the one output, as the full difference would
+    with StagedDifference(specs.A, specs.B, out=str(tmp_path / "staged.lp")) as diff:
+        diff.run()
+    with Difference(specs.A, specs.B, out=str(tmp_path / "full.lp")) as diff:
+        diff.run()
+    facts = [
+        set(x for x in (tmp_path / name).read_text().splitlines() if x[:1] not in "%")
+        for name in ("staged.lp", "full.lp")
+    ]
+    assert any(x.startswith("node(") for x in facts[0])
+    assert facts[0] <= facts[1]
@@ -0,0 +1,221 @@
+# Copyright (C) 2022 Vanessa Sochat.
+
+# This Source Code Form is subject to the terms of the
+# Mozilla Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import random
+
+import pytest
+
+from compspec.asp import Difference
+from compspec.binary import load_graph, pack_graph, save_graph, unpack_view
+from compspec.graph import Graph, GraphView, PathTrie, ReadOnlyGraphError
+
+from .helpers import make_graph, normalize
+
+
+def test_binary_graph(specs, tmp_path):
+    save_graph(specs.A, tmp_path / "A.cspg")
+    save_graph(specs.B, tmp_path / "B.cspg")
+
+    # The mapped graphs have the same facts, and so the same diff
+    with load_graph(tmp_path / "A.cspg") as mA, load_graph(tmp_path / "B.cspg") as mB:
+        assert list(mA.iter_nodes()) == list(specs.A.iter_nodes())
+        assert list(mB.iter_relations()) == list(specs.B.iter_relations())
+        expected = Difference(specs.A, specs.B, quiet=True).run()
+        assert normalize(Difference(mA, mB, quiet=True).run()) == normalize(expected)
+
+
+def test_binary_graph_interface(specs, tmp_path):
+    save_graph(specs.A, tmp_path / "A.cspg")
+    with load_graph(tmp_path / "A.cspg") as g:
+        # Nodes and relations are generated like those of the graph
+        assert g.nodes.keys() == specs.A.nodes.keys()
+        assert [n.to_dict() for n in g.nodes.values()] == [
+            n.to_dict() for n in specs.A.nodes.values()
+        ]
+        assert [r.args for r in g.relations] == [r.args for r in specs.A.relations]
+        relation = specs.A.relations[0]
+        assert g.has_relation(*relation.args)
+        assert not g.has_relation(relation.toid, relation.relation, relation.fromid)
+        assert g.path(relation.toid) == specs.A.path(relation.toid)
+
+        # But the graph can't be added to
+        node = next(iter(specs.A.nodes.values()))
+        for add in (
+            lambda: g.add_node(node),
+            lambda: g.add_relation(relation),
+            lambda: g.new_node("function", "foo"),
+            lambda: g.gen("function", "foo", parent=node.nodeid),
+            lambda: g.bulk_load([node]),
+        ):
+            with pytest.raises(ReadOnlyGraphError):
+                add()
+
+
+def test_graph_view(specs):
+    view = unpack_view(pack_graph(specs.A))
+    assert isinstance(view, GraphView)
+
+    # A view has the nodes, relations and paths of the graph it came from
+    assert view.nodes.keys() == specs.A.nodes.keys()
+    assert [n.to_dict() for n in view.nodes.values()] == [
+        n.to_dict() for n in specs.A.nodes.values()
+    ]
+    assert [r.args for r in view.relations] == [r.args for r in specs.A.relations]
+    relation = specs.A.relations[-1]
+    assert view.has_relation(*relation.args)
+    assert not view.has_relation(relation.toid, relation.relation, relation.fromid)
+    assert view.path(relation.toid) == specs.A.path(relation.toid)
+    assert view.path("missing") == ""
+
+    # And can't be added to
+    with pytest.raises(ReadOnlyGraphError):
+        view.new_relation(relation.fromid, "has", relation.toid)
+    with pytest.raises(ReadOnlyGraphError):
+        view.add_node(specs.A.nodes[relation.toid])
+
+
+def test_bulk_load(specs):
+    g = specs.A
+    nodes = [node.args for node in g.nodes.values()]
+    relations = list(g.iter_relations())
+
+    # Relations in any order give the same paths as building top down
+    random.Random(0).shuffle(nodes)
+    random.Random(0).shuffle(relations)
+    loaded = Graph()
+    loaded.bulk_load(nodes, relations)
+    assert sorted(loaded.iter_nodes()) == sorted(g.iter_nodes())
+
+
+def test_bulk_load_existing():
+    g = make_graph([("a", "library", "libfoo.so", None)])
+    assert g.children("a") == []
+
+    # Loading into a graph uses the paths it has, and queries stay current
+    g.bulk_load([("b", "function", "foo")], [("a", "has", "b")])
+    assert g.children("a") == ["b"] and g.find(name="function") == ["b"]
+    assert g.path("b") == "library:libfoo.so->function:foo"
+
+    # A relation to a node we don't have is an error
+    with pytest.raises(KeyError):
+        Graph().bulk_load([("a", "library", "libfoo.so")], [("a", "has", "c")])
+
+
+def test_path_trie():
+    trie = PathTrie()
+    root = trie.add("library:libfoo.so")
+    foo = trie.add("function:foo", root)
+    bar = trie.add("function:bar", root)
+
+    # Shared ancestry is stored once, and the same path gives the same reference
+    assert trie.add("library:libfoo.so") == root
+    assert trie.add("function:foo", root) == foo
+    assert len(trie) == 3 and len(trie.labels) == 3
+    assert trie.path(foo) == "library:libfoo.so->function:foo"
+    assert trie.segments_of(bar) == ["library:libfoo.so", "function:bar"]
+    assert trie.path(-1) == trie.path(None) == ""
+
+    # The same segment under another parent is another path
+    other = trie.add("function:foo", foo)
+    assert other != foo and len(trie.labels) == 3
+    assert trie.path(other).count("function:foo") == 2
+
+    # And the trie can be rebuilt from its arrays
+    copy = PathTrie.from_arrays(trie.labels, trie.parents, trie.tails)
+    assert [copy.path(x) for x in range(len(copy))] == [
+        trie.path(x) for x in range(len(trie))
+    ]
+    assert copy.add("function:bar", root) == bar
+
+
+def test_graph_paths(specs):
+    g = specs.A
+
+    # Each node path is the path of its parent, then the node
+    for fromid, _, toid in g.iter_relations():
+        parent = g.path(fromid) or g.describe(fromid)
+        assert g.path(toid) == parent + PathTrie.separator + g.describe(toid)
+
+
+def test_unique_relations(specs):
+    g = specs.A
+
+    # Each node (except the root) has one relation, and adding it again does nothing
+    relations = list(g.iter_relations())
+    assert len(relations) == len(set(relations)) == len(g.nodes) - 1
+    fromid, relation, toid = relations[0]
+    assert g.has_relation(fromid, relation, toid)
+    g.new_relation(fromid, relation, toid)
+    assert len(g.relations) == len(relations)
+
+
+def test_graph_queries(specs):
+    g = specs.A
+    relations = list(g.iter_relations())
+    fromid, relation, toid = relations[0]
+    assert toid in g.children(fromid) and fromid in g.parents(toid)
+
+    # Queries match a scan, and stay current as the graph changes
+    nodeid, name, value, _ = next(g.iter_nodes())
+    assert g.find(name=name) == [x[0] for x in g.iter_nodes() if x[1] == name]
+    assert nodeid in g.find(name=name, value=value)
+    node, _ = g.gen("function", "foo", parent=nodeid)
+    assert g.find(name="function", value="foo") == [node.nodeid]
+    assert node.nodeid in g.children(nodeid, relation="has")
+    assert g.subtree(nodeid)[0] == nodeid and node.nodeid in g.subtree(nodeid)
+    assert len(g.subtree(nodeid)) == len(g.nodes)
+
+
+def test_lazy_graph_group(specs):
+    built = []
+
+    class LazyGraphs(specs.model):
+        def extract(self):
+            for name in "first", "second":
+                self.add_builder(name, lambda name=name: built.append(name) or name)
+
+    # Nothing is built until asked for, and then only once
+    group = LazyGraphs(specs.files[0], specs.package)
+    assert "second" in group and not built
+    assert group["second"] == "second" and group["second"] == "second"
+    assert built == ["second"] and not group.is_built("first")
+    assert list(group) == [("first", "first"), ("second", "second")]
+    assert built == ["second", "first"]
+
+
+def test_parallel_graph_group(specs):
+    class ParallelGraphs(specs.model):
+        def extract(self):
+            for name in "spec", "copy":
+                self.add_builder(name, self.extract_spec)
+
+        def extract_spec(self):
+            super().extract()
+            return self.graphs.pop(self.package)
+
+    # Graphs built in workers have the same facts as graphs built here
+    for filename, expected in zip(specs.files, [specs.A, specs.B]):
+        group = ParallelGraphs(filename, specs.package)
+        assert group.build_parallel(workers=2) == ["spec", "copy"]
+        for name, g in group:
+            assert group.is_built(name)
+            assert list(g.iter_nodes()) == list(expected.iter_nodes())
+            assert list(g.iter_relations()) == list(expected.iter_relations())
+
+    # And they can do anything a graph built here can
+    expected = ParallelGraphs(filename, specs.package)["spec"]
+    assert isinstance(g, Graph)
+    assert g.to_dict() == expected.to_dict()
+    assert g.fingerprint() == expected.fingerprint()
+    assert g.subtree_hashes() == expected.subtree_hashes()
+    assert [g.path(x) for x in g.nodes] == [expected.path(x) for x in expected.nodes]
+    fromid, relation, toid = next(expected.iter_relations())
+    assert g.has_relation(fromid, relation, toid)
+    assert g.children(fromid) == expected.children(fromid)
+    assert g.find(name="spec") == expected.find(name="spec")
+    for graph in g, expected:
+        graph.gen("function", "foo", parent=fromid, nodeid="foo")
+    assert list(g.iter_nodes()) == list(expected.iter_nodes())
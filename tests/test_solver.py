@@ -0,0 +1,315 @@
+# Copyright (C) 2022 Vanessa Sochat.
+
+# This Source Code Form is subject to the terms of the
+# Mozilla Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import asyncio
+import gzip
+import json
+import os
+import threading
+
+import clingo
+import pytest
+
+import compspec.asp.lp as lp
+from compspec.asp import Composition, Difference
+from compspec.solver import (
+    PersistentPyclingoDriver,
+    PyclingoDriver,
+    _argify,
+    argify,
+    bench_profiles,
+    profiles,
+    show_signatures,
+)
+
+from .helpers import make_graph, normalize
+
+
+def test_persistent_driver(specs):
+    driver = PersistentPyclingoDriver(max_steps=3)
+
+    # Reusing one driver across diffs should not change any result
+    for gA, gB in [(specs.A, specs.B), (specs.B, specs.A), (specs.A, specs.A)]:
+        expected = Difference(gA, gB, quiet=True).run()
+        result = Difference(gA, gB, quiet=True, driver=driver).run()
+        assert normalize(result) == normalize(expected)
+
+    # The report is the wall time of each solve, by whether it reused a control
+    report = driver.report()
+    assert report["loads"] == 1 and report["solves"] == 3
+    assert report["total"] == sum(seconds for seconds, _ in driver.times)
+    assert [reused for _, reused in driver.times] == [False, True, True]
+    assert report["new_control"] > 0 and report["reused"] > 0
+
+
+@pytest.mark.parametrize("profile", list(profiles))
+def test_solver_profiles(specs, profile):
+    # Profiles change how we search, not what we find
+    expected = Difference(specs.A, specs.B, quiet=True).run()
+    result = Difference(specs.A, specs.B, quiet=True, profile=profile, threads=1).run()
+    assert normalize(result) == normalize(expected)
+
+
+def test_argify():
+    # Equal arguments of different types are distinct symbols, in any order
+    symbols = [argify(x) for x in (1, True, 1.0, "1", True, 1)]
+    assert symbols[:4] == [
+        clingo.Number(1),
+        clingo.String("True"),
+        clingo.String("1.0"),
+        clingo.String("1"),
+    ]
+    assert symbols[4:] == [symbols[1], symbols[0]]
+    assert argify(1.0) != argify(1)
+
+    # Unhashable arguments skip the cache
+    size = _argify.cache_info().currsize
+    assert argify([1, 2]) == clingo.String("[1, 2]")
+    assert _argify.cache_info().currsize == size
+
+
+def test_driver_options(specs):
+    # Options are applied to a driver we are given, and others are kept
+    driver = PyclingoDriver(profile="crafty", threads=3)
+    diff = Difference(specs.A, specs.B, quiet=True, driver=driver, profile="light")
+    assert diff.driver is driver
+    assert (driver.profile, driver.threads, driver.ground_only) == ("light", 3, False)
+    Composition(specs.A, driver=driver, threads="auto", ground_only=True)
+    assert (driver.profile, driver.threads, driver.ground_only) == (
+        "light",
+        "auto",
+        True,
+    )
+    with pytest.raises(ValueError):
+        Difference(specs.A, specs.B, driver=driver, profile="unknown")
+
+
+def test_bench_profiles(tmp_path):
+    A = make_graph([("a", "library", "libfoo.so", None), ("b", "function", "foo", "a")])
+    B = make_graph([("a", "library", "libfoo.so", None), ("b", "function", "bar", "a")])
+    diff = Difference(A, B, quiet=True)
+    diff.dump(tmp_path / "facts.lp")
+    diff.dump(tmp_path / "facts.lp.gz")
+    programs = lp.get_facts(["is-compatible.lp"])
+
+    # Each profile gets a row (its best time), and the fastest is first
+    names = ["default", "clingo"]
+    rows = bench_profiles([str(tmp_path / "facts.lp")] + programs, names, 1, repeat=2)
+    assert sorted(row["profile"] for row in rows) == sorted(names)
+    assert [row["total"] for row in rows] == sorted(row["total"] for row in rows)
+    for row in rows:
+        assert row["satisfiable"] and row["threads"] == "1"
+        assert row["total"] >= row["ground"] + row["solve"] - 1e-6
+
+    # A gzipped fact set is the same problem, and every profile is the default
+    rows = bench_profiles([str(tmp_path / "facts.lp.gz")] + programs, threads=1)
+    assert sorted(row["profile"] for row in rows) == sorted(profiles)
+    assert all(row["satisfiable"] for row in rows)
+    with pytest.raises(ValueError):
+        bench_profiles(programs, ["fastest"])
+
+
+def test_solve_timeout(specs, tmp_path):
+    # Pigeons that don't fit in holes take much longer than this to prove
+    hard = tmp_path / "pigeons.lp"
+    hard.write_text(
+        "pigeon(1..14). hole(1..13).\n"
+        "1 { in(P,H) : hole(H) } 1 :- pigeon(P).\n"
+        ":- in(P,H), in(Q,H), P < Q.\n"
+    )
+    comp = Composition(specs.A, quiet=True)
+    asyncio.run(comp.run_async(str(hard), timeout=0.5))
+    assert comp.result.interrupted
+    assert comp.result.satisfiable is None
+
+
+def test_cancel_after_search(specs, tmp_path):
+    program = tmp_path / "program.lp"
+    program.write_text("found :- node(_, _, _, _, _).\n")
+    preparing = threading.Event()
+    release = threading.Event()
+
+    class SlowComposition(Composition):
+        def prepare_result(self, result):
+            preparing.set()
+            release.wait()
+            return result
+
+    async def cancel_while_preparing(comp):
+        task = asyncio.ensure_future(comp.run_async(str(program)))
+        await asyncio.get_running_loop().run_in_executor(None, preparing.wait)
+        task.cancel()
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    # The search had finished, so the next run should not be interrupted
+    comp = SlowComposition(specs.A, quiet=True)
+    asyncio.run(cancel_while_preparing(comp))
+    assert comp.run(str(program)) and not comp.result.interrupted
+    assert comp.result.satisfiable
+
+
+def test_facts_without_solver(specs, tmp_path):
+    g = specs.A
+
+    # Without logic programs the answers are the facts, as a solve would give
+    comp = Composition(g, quiet=True)
+    answers = comp.run()
+    expected = comp.driver.solve_once(comp.facts, 1, logic_programs=[]).answers
+    assert answers == expected
+    assert "ground" not in comp.result.timings
+
+    # The facts can also be written out, the same as the output of a run
+    comp.dump(tmp_path / "facts.lp")
+    Composition(g, out=str(tmp_path / "run.lp")).run()
+    assert (tmp_path / "facts.lp").read_text() == (tmp_path / "run.lp").read_text()
+
+
+def test_quiet_and_gzip_output(specs, tmp_path, capsys):
+    # By default the facts are written to the terminal, and quiet writes nothing
+    Composition(specs.A).run()
+    expected = capsys.readouterr().out
+    assert "node(" in expected
+    Composition(specs.A, quiet=True).run()
+    assert capsys.readouterr().out == ""
+
+    # An output file ending in .gz is compressed, and closed with the composition
+    with Composition(specs.A, out=str(tmp_path / "facts.lp.gz")) as comp:
+        comp.run()
+    assert (tmp_path / "facts.lp.gz").read_bytes()[:2] == b"\x1f\x8b"
+    with gzip.open(tmp_path / "facts.lp.gz", "rt") as fd:
+        assert fd.read() == expected
+
+    # Or compression can be asked for (or not) by the driver
+    driver = PyclingoDriver(compress=False)
+    with Composition(specs.A, driver=driver, out=str(tmp_path / "facts.gz")) as comp:
+        comp.run()
+    assert (tmp_path / "facts.gz").read_text() == expected
+    comp.dump(tmp_path / "dump.lp.gz")
+    with gzip.open(tmp_path / "dump.lp.gz", "rt") as fd:
+        assert fd.read() == expected
+
+
+def test_default_nmodels(specs, tmp_path):
+    choice = tmp_path / "choice.lp"
+    choice.write_text("{ picked }.\n")
+
+    # The default programs have one answer set, so we stop at the first
+    diff = Difference(specs.A, specs.B, quiet=True)
+    defaults = diff._load_logic_programs()
+    assert diff.default_nmodels(defaults) == 1
+    diff.run()
+    assert diff.result.nmodels == 1
+
+    # Any other program might have more, so we look for all of them
+    programs = diff._load_logic_programs(str(choice))
+    assert diff.default_nmodels(programs) == 0
+    diff.run(str(choice))
+    assert diff.result.nmodels == 2
+    diff.run(str(choice), nmodels=1)
+    assert diff.result.nmodels == 1
+    comp = Composition(specs.A, quiet=True)
+    assert comp.default_nmodels([]) == 1
+    comp.run(str(choice))
+    assert comp.result.nmodels == 2
+
+
+def test_timings_and_statistics(specs):
+    # A solve is timed by phase, and the solver counts are kept
+    diff = Difference(specs.A, specs.B, quiet=True)
+    diff.run()
+    result = diff.result
+    assert list(result.timings) == ["setup", "load", "ground", "solve"]
+    assert all(seconds >= 0 for seconds in result.timings.values())
+    assert result.statistics["atoms"] > 0 and result.statistics["rules"] > 0
+    assert set(result.statistics) == {"atoms", "rules", "conflicts", "choices"}
+    saved = json.loads(json.dumps(result.to_dict()))
+    assert saved["timings"] == result.timings and saved["satisfiable"]
+
+    # The native engine has no solver, but is still timed
+    diff = Difference(specs.A, specs.B, quiet=True, engine="native")
+    diff.run()
+    assert list(diff.result.timings) == ["setup", "solve"]
+
+
+class CountingDriver(PyclingoDriver):
+    """
+    A driver that counts solves, and searches.
+    """
+
+    solves = 0
+    searches = 0
+
+    def solve_once(self, *args, **kwargs):
+        self.solves += 1
+        return super().solve_once(*args, **kwargs)
+
+    def search(self, **kwargs):
+        self.searches += 1
+        return super().search(**kwargs)
+
+
+@pytest.mark.parametrize("lazy_cores", [True, False])
+def test_lazy_cores(specs, tmp_path, lazy_cores):
+    unsat = tmp_path / "unsat.lp"
+    unsat.write_text(":- node(_, _, _, _, _).\n")
+    sat = tmp_path / "sat.lp"
+    sat.write_text("found :- node(_, _, _, _, _).\n")
+
+    # Lazy cores solve again (with assumptions) only when there is no answer
+    driver = CountingDriver(lazy_cores=lazy_cores)
+    comp = Composition(specs.A, quiet=True, driver=driver)
+    assert comp.run(str(sat)) and comp.result.satisfiable
+    assert driver.solves == 1 and not comp.result.cores
+    assert not comp.run(str(unsat)) and comp.result.satisfiable is False
+    assert driver.solves == (3 if lazy_cores else 2)
+    assert comp.result.cores and all(comp.result.cores)
+    assert all(any(x.name == "node" for x in core) for core in comp.result.cores)
+
+    # Without cores we never solve again
+    driver = CountingDriver(cores=False, lazy_cores=lazy_cores)
+    comp = Composition(specs.A, quiet=True, driver=driver)
+    assert not comp.run(str(unsat)) and not any(comp.result.cores)
+    assert driver.solves == 1
+
+
+def test_ground_only(specs, tmp_path):
+    choice = tmp_path / "choice.lp"
+    choice.write_text("{ picked }.\n")
+
+    # Without a changed node, grounding decides the default programs
+    A = make_graph([("a", "library", "libfoo.so", None), ("b", "function", "foo", "a")])
+    B = make_graph([("a", "library", "libfoo.so", None), ("c", "function", "bar", "a")])
+    expected = Difference(A, B, quiet=True).run()
+    driver = CountingDriver(ground_only=True)
+    result = Difference(A, B, quiet=True, driver=driver).run()
+    assert normalize(result) == normalize(expected)
+    assert result["added_node"] and result["removed_node"]
+    assert driver.searches == 0
+
+    # Otherwise we search, with the same answers as without ground_only
+    driver = CountingDriver(ground_only=True)
+    diff = Difference(specs.A, specs.B, quiet=True, driver=driver)
+    for program in None, str(choice):
+        expected = Difference(specs.A, specs.B, quiet=True).run(program)
+        assert normalize(diff.run(program)) == normalize(expected)
+    assert driver.searches == 2
+
+    # A composition can ask for it too
+    assert Difference(A, B, ground_only=True).driver.ground_only
+
+
+def test_show_signatures(tmp_path):
+    program = tmp_path / "show.lp"
+    program.write_text("a. b.\n#show a/0.\n")
+    assert show_signatures([str(program)]) == ({("a", 0, True)}, False)
+
+    # Editing the program is seen in the same process
+    program.write_text("a. b.\n#show b/0.\n")
+    stat = program.stat()
+    os.utime(program, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert show_signatures([str(program)]) == ({("b", 0, True)}, False)